@@ -0,0 +1,387 @@
+import os
+import sys
+import json
+import time
+import random
+import sqlite3
+import argparse
+import platform
+import statistics
+import subprocess
+import tempfile
+import tracemalloc
+import re
+import itertools
+
+# Without a running Anki the package only provides its core modules, which import neither aqt nor Qt
+src_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'src')
+sys.path.insert(0, src_path)
+
+import bs4
+from bs4 import BeautifulSoup
+
+from anking_tables.normalize import normalize_table, deheader_soup, headerize_soup
+from anking_tables.text import extract_html_text
+from anking_tables.locate import table_spans
+from anking_tables.parse_cache import get_parse_cache
+from anking_tables.table_index import TableIndex, FIELD_SEPARATOR
+from anking_tables.canonical import table_fingerprint, cluster_key
+from anking_tables.similarity import table_signature
+from anking_tables.bulk_apply import apply_to_all, NotFoundError
+from anking_tables.scanner import scan_tables
+from anking_tables.lint import TableLinter
+
+RESULTS_VERSION = 1
+
+# Synthetic tables: name, rows, columns, span density, image density, formatting depth
+CASES = [
+    ('small', 5, 3, 0.0, 0.0, 1),
+    ('medium', 20, 6, 0.0, 0.0, 1),
+    ('medium_spans', 20, 6, 0.15, 0.0, 1),
+    ('medium_images', 20, 6, 0.0, 0.2, 1),
+    ('medium_formatting', 20, 6, 0.0, 0.0, 4),
+    ('large', 100, 10, 0.05, 0.05, 2),
+    ('huge', 400, 12, 0.05, 0.05, 2),
+]
+
+# Notes in the stand-in collection for Apply to All, and how many of them contain the edited table
+APPLY_NOTES = 2000
+APPLY_MATCH_RATIO = 0.1
+
+WORDS = ['artery', 'nerve', 'muscle', 'insulin', 'cortisol', 'kidney', 'renal', 'hepatic', 'type', 'acute',
+         'chronic', 'deficiency', 'syndrome', 'inhibitor', 'receptor', 'increased', 'decreased', 'treatment']
+FORMATTING = [('b', ''), ('i', ''), ('u', ''), ('span', ' style="color: rgb(0, 0, 0);"'),
+              ('font', ' color="#333"'), ('div', ' class="x"')]
+
+
+def generate_table(rows, cols, span_density=0.0, image_density=0.0, depth=1, seed=0):
+    """Return the HTML of a synthetic table in a field, like the ones pasted into the Step deck."""
+    rng = random.Random(seed)
+    covered = set()
+    parts = ['<div>Intro text</div><table style="width: 100%;" class="pasted"><tbody>']
+    for r in range(rows):
+        parts.append('<tr style="height: 20px;">')
+        for c in range(cols):
+            if (r, c) in covered:
+                continue
+            attrs = ' style="border: 1px solid;"'
+            if r and rng.random() < span_density:
+                if rng.random() < 0.5 and c + 1 < cols and (r, c + 1) not in covered:
+                    attrs += ' colspan="2"'
+                    covered.add((r, c + 1))
+                elif r + 1 < rows:
+                    attrs += ' rowspan="2"'
+                    covered.add((r + 1, c))
+            content = ' '.join(rng.choice(WORDS) for _ in range(rng.randint(1, 6)))
+            for _ in range(depth):
+                tag, tag_attrs = rng.choice(FORMATTING)
+                content = f'<{tag}{tag_attrs}>{content}</{tag}>'
+            if rng.random() < image_density:
+                content += f'<img src="paste-{rng.getrandbits(32):08x}.jpg" width="120" style="float: left;">'
+            tag = 'th' if r == 0 else 'td'
+            parts.append(f'<{tag}{attrs}>{content}</{tag}>')
+        parts.append('</tr>')
+    parts.append('</tbody></table><br>Photo credit: none')
+    return ''.join(parts)
+
+
+def load_corpus(path):
+    """Load fields from a JSON lines file ({"html": ...} per line) or a folder of .html files."""
+    fields = []
+    if os.path.isdir(path):
+        for name in sorted(os.listdir(path)):
+            if name.endswith('.html'):
+                with open(os.path.join(path, name), encoding='utf-8') as f:
+                    fields.append((os.path.splitext(name)[0], f.read()))
+    else:
+        with open(path, encoding='utf-8') as f:
+            for number, line in enumerate(f):
+                if line.strip():
+                    record = json.loads(line)
+                    fields.append((record.get('name', f'corpus_{number}'), record['html']))
+    return fields
+
+
+_TEXT_OR_TAG = re.compile(r'(<!--.*?-->|<[^>]*>)', re.DOTALL)
+_LETTER = re.compile(r'(&#?\w+;)|[^\W\d_]')
+_SRC = re.compile(r'src="[^"]*"')
+
+
+def anonymize(html):
+    """Replace the letters of the text with x and the image names with placeholders, keeping the markup."""
+    images = itertools.count(1)
+    parts = _TEXT_OR_TAG.split(html)
+    for i, part in enumerate(parts):
+        if i % 2:
+            parts[i] = _SRC.sub(lambda match: f'src="image{next(images)}.jpg"', part)
+        else:
+            parts[i] = _LETTER.sub(lambda match: match.group(1) or 'x', part)
+    return ''.join(parts)
+
+
+def export_corpus(collection_path, output_path, limit=None):
+    """Write the anonymized tables of an Anki collection file to a JSON lines corpus."""
+    db = sqlite3.connect(f'file:{collection_path}?mode=ro', uri=True)
+    count = 0
+    with open(output_path, 'w', encoding='utf-8') as f:
+        for note_id, flds in db.execute("select id, flds from notes where flds like '%<table%'"):
+            for field_idx, field_html in enumerate(flds.split(FIELD_SEPARATOR)):
+                for start, end in table_spans(field_html):
+                    f.write(json.dumps({'name': f'{note_id}_{field_idx}_{start}',
+                                        'html': anonymize(field_html[start:end])}) + '\n')
+                    count += 1
+            if limit and count >= limit:
+                break
+    db.close()
+    return count
+
+
+class StandInNote:
+    def __init__(self, col, note_id):
+        flds = col.db.scalar("select flds from notes where id = ?", note_id)
+        if flds is None:
+            raise NotFoundError(f"No note with id {note_id}")
+        self.id = note_id
+        self.fields = flds.split(FIELD_SEPARATOR)
+
+
+class StandInDB:
+    def __init__(self, connection):
+        self.connection = connection
+
+    def all(self, sql, *args):
+        return self.connection.execute(sql, args).fetchall()
+
+    def list(self, sql, *args):
+        return [row[0] for row in self.connection.execute(sql, args)]
+
+    def scalar(self, sql, *args):
+        row = self.connection.execute(sql, args).fetchone()
+        return row[0] if row else None
+
+
+class StandInCollection:
+    """The parts of anki.collection.Collection the table pipeline uses, backed by an in-memory notes table."""
+
+    def __init__(self, fields_per_note):
+        connection = sqlite3.connect(':memory:')
+        connection.execute("create table notes (id integer primary key, mod integer not null, flds text not null)")
+        connection.executemany("insert into notes values (?, ?, ?)",
+                               [(note_id, note_id, FIELD_SEPARATOR.join(fields))
+                                for note_id, fields in enumerate(fields_per_note, 1)])
+        self.db = StandInDB(connection)
+        self.undo_entries = 0
+
+    def find_notes(self, query):
+        return self.db.list("select id from notes")
+
+    def get_note(self, note_id):
+        return StandInNote(self, note_id)
+
+    def update_notes(self, notes):
+        mod = int(time.time())
+        self.db.connection.executemany("update notes set flds = ?, mod = ? where id = ?",
+                                       [(FIELD_SEPARATOR.join(note.fields), mod, note.id) for note in notes])
+
+    def add_custom_undo_entry(self, name):
+        self.undo_entries += 1
+        return self.undo_entries
+
+    def merge_undo_entries(self, target):
+        return None
+
+
+def measure(func, setup, repeat):
+    """Time func(setup()) repeat times, then run it once more under tracemalloc for the allocation peak."""
+    times = []
+    for _ in range(repeat):
+        arg = setup()
+        start = time.perf_counter()
+        func(arg)
+        times.append(time.perf_counter() - start)
+    arg = setup()
+    tracemalloc.start()
+    func(arg)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {
+        'min_ms': round(min(times) * 1000, 3),
+        'median_ms': round(statistics.median(times) * 1000, 3),
+        'peak_kib': round(peak / 1024, 1),
+        'repeat': repeat,
+    }
+
+
+CORE_MODULES = ['anking_tables.normalize', 'anking_tables.locate', 'anking_tables.text', 'anking_tables.table_index',
+                'anking_tables.similarity', 'anking_tables.bulk_apply', 'anking_tables.bulk_normalize']
+
+
+def measure_import(repeat):
+    """Time importing the core modules in fresh interpreters."""
+    code = f"import time; start = time.perf_counter(); import {', '.join(CORE_MODULES)}; " \
+           f"print(time.perf_counter() - start)"
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, [src_path, os.environ.get('PYTHONPATH')])))
+    times = [float(subprocess.run([sys.executable, '-c', code], capture_output=True, text=True, env=env,
+                                  check=True).stdout) for _ in range(repeat)]
+    return {
+        'min_ms': round(min(times) * 1000, 3),
+        'median_ms': round(statistics.median(times) * 1000, 3),
+        'peak_kib': None,
+        'repeat': repeat,
+    }
+
+
+def table_stages(html):
+    """Return the (stage, func, setup) of the per-table stages for a field."""
+    def parsed():
+        return BeautifulSoup(html, 'html.parser')
+
+    def uncached():
+        get_parse_cache().clear()
+        return html
+
+    def linted():
+        # A linter that has seen the field, and the field after typing into its last row
+        linter = TableLinter()
+        linter.lint(html)
+        position = html.rfind('</td>')
+        return linter, html[:position] + 'x' + html[position:]
+
+    return [
+        ('parse', lambda field: BeautifulSoup(field, 'html.parser'), lambda: html),
+        ('locate', table_spans, lambda: html),
+        ('process_table', lambda soup: [normalize_table(table) for table in soup.find_all('table')], parsed),
+        ('deheader_first_column', deheader_soup, parsed),
+        ('headerize_first_column', headerize_soup, parsed),
+        ('extract_html_text', extract_html_text, uncached),
+        ('fingerprint', lambda soup: [(table_fingerprint(table), table_signature(table))
+                                      for table in soup.find_all('table')], parsed),
+        ('lint', lambda field: TableLinter().lint(field), lambda: html),
+        ('lint_edit', lambda args: args[0].lint(args[1]), linted),
+    ]
+
+
+def apply_to_all_stages(notes, seed=0):
+    """Return the stages of Apply to All on a stand-in collection with notes notes."""
+    rng = random.Random(seed)
+    edited = generate_table(20, 6, seed=seed)
+    edited_table = edited[edited.index('<table'):edited.index('</table>') + len('</table>')]
+    fields_per_note = []
+    for number in range(notes):
+        if rng.random() < APPLY_MATCH_RATIO:
+            table = edited
+        else:
+            table = generate_table(rng.randint(3, 20), rng.randint(2, 6), seed=seed + number + 1)
+        fields_per_note.append([f'Front {number}', table, ''])
+    replacements = {cluster_key(edited_table): edited_table.replace('pasted', 'one')}
+    workdir = tempfile.mkdtemp(prefix='anking_tables_bench_')
+
+    def fresh_index():
+        path = os.path.join(workdir, 'index.sqlite')
+        if os.path.exists(path):
+            os.remove(path)
+        return StandInCollection(fields_per_note), TableIndex(path)
+
+    def built_index():
+        col, index = fresh_index()
+        index.sync(col)
+        return col, index
+
+    return [
+        ('scan_tables', lambda args: sum(1 for _ in scan_tables(args[0])), fresh_index),
+        ('index_build', lambda args: args[1].sync(args[0]), fresh_index),
+        ('apply_to_all', lambda args: apply_to_all(args[0], args[1], replacements), built_index),
+    ]
+
+
+def run(cases, corpus, repeat, apply_notes):
+    results = []
+    result = measure_import(max(1, repeat // 2))
+    result.update(case='package', stage='import_core', length=len(CORE_MODULES))
+    results.append(result)
+    print(f"{'package':24} {'import_core':24} {result['median_ms']:10.3f} ms")
+    for name, html in cases + corpus:
+        for stage, func, setup in table_stages(html):
+            result = measure(func, setup, repeat)
+            result.update(case=name, stage=stage, length=len(html))
+            results.append(result)
+            print(f"{name:24} {stage:24} {result['median_ms']:10.3f} ms  {result['peak_kib']:10.1f} KiB")
+    if apply_notes:
+        name = f'collection_{apply_notes}'
+        for stage, func, setup in apply_to_all_stages(apply_notes):
+            result = measure(func, setup, max(1, repeat // 5))
+            result.update(case=name, stage=stage, length=apply_notes)
+            results.append(result)
+            print(f"{name:24} {stage:24} {result['median_ms']:10.3f} ms  {result['peak_kib']:10.1f} KiB")
+    return results
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        return None
+
+
+def compare(results, baseline_path, threshold):
+    """Print the stages that got slower than the baseline by more than threshold, return whether there are any."""
+    with open(baseline_path, encoding='utf-8') as f:
+        baseline = {(result['case'], result['stage']): result for result in json.load(f)['results']}
+    regressions = False
+    for result in results:
+        old = baseline.get((result['case'], result['stage']))
+        if not old or not old['median_ms']:
+            continue
+        ratio = result['median_ms'] / old['median_ms']
+        if ratio > threshold:
+            regressions = True
+            print(f"SLOWER {result['case']} {result['stage']}: {old['median_ms']} -> {result['median_ms']} ms "
+                  f"({ratio:.2f}x)")
+    return regressions
+
+
+if __name__ == '__main__':
+    # Parse command line arguments
+    parser = argparse.ArgumentParser(description="Benchmark the table pipeline without Anki")
+    parser.add_argument('-o', '--output', default='bench_results.json', help="JSON file the results are written to")
+    parser.add_argument('-r', '--repeat', type=int, default=10, help="Runs per stage")
+    parser.add_argument('--corpus', help="JSON lines file or folder of .html files with real tables")
+    parser.add_argument('--apply-notes', type=int, default=APPLY_NOTES,
+                        help="Notes in the stand-in collection for Apply to All (0 skips it)")
+    parser.add_argument('--quick', action='store_true', help="Only the small and medium tables, few runs")
+    parser.add_argument('--compare', help="Earlier results file to check for regressions")
+    parser.add_argument('--threshold', type=float, default=1.2, help="Slowdown ratio reported as a regression")
+    parser.add_argument('--export-corpus', metavar='COLLECTION',
+                        help="Write the anonymized tables of a collection.anki2 file to the --corpus file and exit")
+    args = parser.parse_args()
+
+    if args.export_corpus:
+        if not args.corpus:
+            parser.error("--export-corpus needs --corpus for the output file")
+        print(f"Exported {export_corpus(args.export_corpus, args.corpus)} tables to {args.corpus}")
+        sys.exit(0)
+
+    selected = [case for case in CASES if not args.quick or case[0].startswith(('small', 'medium'))]
+    cases = [(name, generate_table(rows, cols, spans, images, depth, seed=number))
+             for number, (name, rows, cols, spans, images, depth) in enumerate(selected)]
+    corpus = load_corpus(args.corpus) if args.corpus else []
+    repeat = 3 if args.quick else args.repeat
+    apply_notes = min(args.apply_notes, 200) if args.quick else args.apply_notes
+
+    results = run(cases, corpus, repeat, apply_notes)
+    report = {
+        'version': RESULTS_VERSION,
+        'timestamp': int(time.time()),
+        'commit': git_commit(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'bs4': bs4.__version__,
+        'results': results,
+    }
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=1)
+    print(f"Results written to {args.output}")
+
+    if args.compare and compare(results, args.compare, args.threshold):
+        sys.exit(1)
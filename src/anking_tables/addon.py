@@ -0,0 +1,138 @@
+import os
+import time
+
+from aqt import gui_hooks, mw
+
+try:
+    from PyQt6.QtGui import QAction
+    from PyQt6.QtWidgets import QMessageBox
+except ImportError:
+    from PyQt5.QtWidgets import QAction, QMessageBox
+
+# Only light modules are imported here. BeautifulSoup, the editor window and QtWebEngine are imported the first time
+# they are needed, so Anki's startup does not pay for them.
+from .locate import table_spans
+from .log import get_logger, setup_logging, set_level, timer
+from .profiling import get_profiler
+from .utils import is_night_mode, sync_table_index_in_background, user_files_path, get_config, \
+    invalidate_tag_registry
+
+logger = get_logger("addon")
+
+
+def open_main_window_func(editor):
+    # Get the note object associated with the current card
+    note = editor.note
+
+    if editor.currentField is not None:
+        field_html = note.fields[editor.currentField]
+    else:
+        # Display a warning message and return
+        QMessageBox.warning(None, "Warning", "Please place your cursor in the field of the table you would like to "
+                                             "edit.")
+        return
+
+    # Get the field name & card ID of the selected field
+    note_id = note.id
+    field_name = note.note_type()['flds'][editor.currentField]['name']
+
+    card = editor.card
+
+    # Check if there are any tables in the HTML
+    if not table_spans(field_html):
+        # If there are no tables in the selected field, show an error message and return
+        QMessageBox.warning(None, "Error",
+                            "There are no tables in this field, please place the cursor in the field of the table "
+                            "you would like to edit.")
+        return
+
+    with timer("import editor", logger):
+        from .main_window import HtmlViewer
+
+    # Pass thingies (idk how to code so idk what it's called) to the HtmlViewer
+    with timer("open window", logger):
+        viewer = HtmlViewer(field_html, card, mw, mw.col, editor, field_name, note_id)
+
+    # Store the HtmlViewer object in the Editor object
+    editor.html_viewer = viewer
+    viewer.show()
+
+
+def add_buttons(buttons, editor):
+    icon_path = os.path.join(os.path.dirname(__file__), 'icons', 'table_editor_toolbar_dark.png' if is_night_mode else 'table_editor_toolbar_light.png')
+    btn = editor.addButton(
+        icon=icon_path,
+        cmd="OpenMainWindow",
+        func=lambda _: open_main_window_func(editor),
+        tip="Open Table Editor",
+        keys=None,
+    )
+    buttons.append(btn)
+
+
+def open_bulk_normalize_dialog():
+    from .bulk_dialog import open_bulk_normalize_dialog as open_dialog
+    open_dialog()
+
+
+def open_audit_dialog():
+    from .audit_dialog import open_audit_dialog as open_dialog
+    open_dialog()
+
+
+def open_cluster_dialog():
+    from .cluster_dialog import open_cluster_dialog as open_dialog
+    open_dialog()
+
+
+def open_tag_dialog():
+    from .tag_dialog import open_tag_dialog as open_dialog
+    open_dialog()
+
+
+def add_tools_menu_action():
+    action = QAction("Normalize Tables...", mw)
+    action.triggered.connect(open_bulk_normalize_dialog)
+    mw.form.menuTools.addAction(action)
+
+    audit_action = QAction("Audit Tables...", mw)
+    audit_action.triggered.connect(open_audit_dialog)
+    mw.form.menuTools.addAction(audit_action)
+
+    cluster_action = QAction("Duplicate Tables...", mw)
+    cluster_action.triggered.connect(open_cluster_dialog)
+    mw.form.menuTools.addAction(cluster_action)
+
+    tag_action = QAction("Manage Table Tags...", mw)
+    tag_action.triggered.connect(open_tag_dialog)
+    mw.form.menuTools.addAction(tag_action)
+
+
+def on_operation_did_execute(changes, handler):
+    # Keep the table index current when notes are edited, added or synced
+    if changes.note_text:
+        sync_table_index_in_background()
+    # Tags changed outside the table editor, the registry is read again the next time it is used
+    if changes.tag:
+        invalidate_tag_registry()
+
+
+def register(load_start=None):
+    """Set up logging and register the hooks and menu action with Anki."""
+    setup_logging(user_files_path("anking_tables.log"), get_config().get("log_level", "WARNING"))
+    mw.addonManager.setConfigUpdatedAction(__name__,
+                                           lambda new_config: set_level(new_config.get("log_level", "WARNING")))
+
+    # Stage timings are collected for the whole session only when asked for, otherwise while a performance panel is
+    # open, so timed stages cost nothing the rest of the time
+    if get_config().get("profile_stages", False):
+        get_profiler().enable()
+
+    gui_hooks.editor_did_init_buttons.append(add_buttons)
+    gui_hooks.profile_did_open.append(sync_table_index_in_background)
+    gui_hooks.operation_did_execute.append(on_operation_did_execute)
+
+    add_tools_menu_action()
+
+    if load_start is not None:
+        logger.debug("Add-on loaded in %.1f ms", (time.perf_counter() - load_start) * 1000)
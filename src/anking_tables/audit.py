@@ -0,0 +1,108 @@
+import csv
+from collections import Counter
+
+from .grid import TableGrid
+from .log import get_logger, timer
+from .normalize import TAG_WHITELIST, PRESERVED_ATTRIBUTES, DEFAULT_PRESERVED_ATTRIBUTES
+
+logger = get_logger("audit")
+
+# Violation codes, in report order, with the rule of the table format they break
+VIOLATIONS = {
+    'class': 'Table class is not "one"',
+    'border': 'Table border is not 1',
+    'tags': 'Tags outside the whitelist',
+    'attributes': 'Styling or other attributes',
+    'header': 'Header row is not all header cells',
+    'credits': 'Photo credits inside the table',
+}
+
+# Attributes the table element itself keeps
+TABLE_ATTRIBUTES = frozenset(['class', 'border'])
+
+CREDITS_TEXT = "Photo credit: "
+
+
+def audit_table(table):
+    """Return the codes of the format rules a table element breaks, in VIOLATIONS order."""
+    found = set()
+    if table.get('class') != ['one']:
+        found.add('class')
+    if table.get('border') != '1':
+        found.add('border')
+    if any(key not in TABLE_ATTRIBUTES for key in table.attrs):
+        found.add('attributes')
+
+    for element in table.find_all(True):
+        name = element.name
+        if name not in TAG_WHITELIST:
+            found.add('tags')
+        if element.attrs and 'attributes' not in found:
+            preserved = PRESERVED_ATTRIBUTES.get(name, DEFAULT_PRESERVED_ATTRIBUTES)
+            if name == 'table':
+                preserved = TABLE_ATTRIBUTES
+            if any(key not in preserved for key in element.attrs):
+                found.add('attributes')
+
+    grid = TableGrid.from_table(table)
+    if grid.height:
+        header_row = 1 if grid.is_merged_row(0) else 0
+        if header_row < grid.height and any(cell.element.name != 'th' for cell in grid.row_cells(header_row)):
+            found.add('header')
+
+    if CREDITS_TEXT in table.get_text():
+        found.add('credits')
+    return tuple(code for code in VIOLATIONS if code in found)
+
+
+def pack_violations(violations):
+    return ','.join(violations)
+
+
+def unpack_violations(text):
+    return tuple(text.split(',')) if text else ()
+
+
+class AuditReport:
+    """Violations of every indexed table: (note id, field index, table position, violation codes) per table."""
+
+    def __init__(self, rows):
+        self.rows = rows
+        self.tables = len(rows)
+        self.notes = len({row[0] for row in rows})
+        self.counts = Counter(code for row in rows for code in row[3])
+        self.failing = [row for row in rows if row[3]]
+
+    def note_ids(self, violation=None):
+        """Return the ids of the notes with a table breaking the given rule (any rule when None)."""
+        return sorted({row[0] for row in self.failing if violation is None or violation in row[3]})
+
+    def summary(self):
+        failing_notes = len({row[0] for row in self.failing})
+        return (f"{len(self.failing)} of {self.tables} tables in {failing_notes} of {self.notes} notes break the table "
+                f"format.")
+
+    def write_csv(self, path, field_names=None):
+        """Write one line per failing table. field_names maps (note id, field index) to the field name."""
+        with open(path, 'w', newline='', encoding='utf-8') as f:
+            writer = csv.writer(f)
+            writer.writerow(['note_id', 'field', 'table', 'violations'] + list(VIOLATIONS))
+            for nid, field_idx, position, violations in self.failing:
+                field = field_names.get((nid, field_idx), field_idx) if field_names else field_idx
+                writer.writerow([nid, field, position + 1, ' '.join(violations)]
+                                + [int(code in violations) for code in VIOLATIONS])
+
+
+def run_audit(col, index, workers=1):
+    """Bring the table index up to date and return the audit of every table in the collection.
+
+    Violations are stored in the index with the fingerprints, so only notes modified since the last sync are parsed
+    again. workers is the size of the process pool for the first build of the index.
+    """
+    with timer("audit sync", logger):
+        index.sync(col, workers=workers)
+    rows = [(nid, field_idx, position, unpack_violations(violations))
+            for nid, field_idx, position, violations in index.violations()]
+    report = AuditReport(rows)
+    logger.info("Audit: %s", report.summary())
+    return report
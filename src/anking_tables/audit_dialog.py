@@ -0,0 +1,118 @@
+from aqt import mw
+from aqt.operations import QueryOp
+from aqt.utils import showWarning, tooltip
+
+try:
+    from PyQt6.QtWidgets import QDialog, QVBoxLayout, QHBoxLayout, QLabel, QListWidget, QPushButton, QFileDialog
+except (ImportError, AttributeError):
+    from PyQt5.QtWidgets import QDialog, QVBoxLayout, QHBoxLayout, QLabel, QListWidget, QPushButton, QFileDialog
+
+from .audit import VIOLATIONS, run_audit
+from .bulk_normalize import default_workers
+from .log import get_logger
+from .utils import get_table_index, search_text, get_config
+
+logger = get_logger("audit_dialog")
+
+
+class AuditDialog(QDialog):
+    """Shows how many tables in the collection break each rule of the table format."""
+
+    def __init__(self, parent=None):
+        super().__init__(parent or mw)
+        self.setWindowTitle("Table Audit")
+        self.setMinimumWidth(420)
+        self.report = None
+        # Violation code of each row of the list, None for the "any violation" row
+        self.codes = []
+
+        self.summary_label = QLabel("Auditing tables...")
+        self.summary_label.setWordWrap(True)
+        self.violation_list = QListWidget()
+        self.violation_list.itemDoubleClicked.connect(self.browse)
+
+        browse_button = QPushButton("Browse")
+        browse_button.setToolTip("Open the notes with the selected violation in the Browser")
+        browse_button.clicked.connect(self.browse)
+        export_button = QPushButton("Export CSV...")
+        export_button.clicked.connect(self.export_csv)
+        rerun_button = QPushButton("Re-run")
+        rerun_button.clicked.connect(self.run)
+        close_button = QPushButton("Close")
+        close_button.clicked.connect(self.close)
+        buttons = QHBoxLayout()
+        buttons.addWidget(browse_button)
+        buttons.addWidget(export_button)
+        buttons.addStretch(1)
+        buttons.addWidget(rerun_button)
+        buttons.addWidget(close_button)
+
+        layout = QVBoxLayout(self)
+        layout.addWidget(self.summary_label)
+        layout.addWidget(self.violation_list)
+        layout.addLayout(buttons)
+
+    def run(self):
+        self.summary_label.setText("Auditing tables...")
+
+        def on_failure(error):
+            logger.error("Table audit failed: %s", error)
+            showWarning(f"Table audit failed: {error}", parent=self)
+
+        workers = get_config().get("bulk_normalize_workers")
+        workers = default_workers() if workers is None else workers
+        QueryOp(parent=self, op=lambda col: run_audit(col, get_table_index(), workers), success=self.show_report) \
+            .failure(on_failure).with_progress("Auditing tables...").run_in_background()
+
+    def show_report(self, report):
+        self.report = report
+        self.summary_label.setText(report.summary())
+        self.violation_list.clear()
+        self.codes = [None]
+        self.violation_list.addItem(f"Any violation: {len(report.failing)} tables")
+        for code, description in VIOLATIONS.items():
+            self.codes.append(code)
+            self.violation_list.addItem(f"{description}: {report.counts.get(code, 0)} tables")
+        self.violation_list.setCurrentRow(0)
+
+    def browse(self, *args):
+        if self.report is None or self.violation_list.currentRow() < 0:
+            return
+        note_ids = self.report.note_ids(self.codes[self.violation_list.currentRow()])
+        if not note_ids:
+            tooltip("No notes with this violation", parent=self)
+            return
+        search_text("nid:" + ",".join(map(str, note_ids)))
+
+    def export_csv(self):
+        if self.report is None:
+            return
+        path, _ = QFileDialog.getSaveFileName(self, "Export Table Audit", "table_audit.csv", "CSV files (*.csv)")
+        if not path:
+            return
+        try:
+            self.report.write_csv(path, self.field_names())
+        except OSError as error:
+            showWarning(f"Could not write {path}: {error}", parent=self)
+            return
+        tooltip(f"Exported {len(self.report.failing)} tables", parent=self)
+
+    def field_names(self):
+        """Return the field name of every failing (note id, field index)."""
+        note_ids = self.report.note_ids()
+        names = {}
+        for start in range(0, len(note_ids), 500):
+            batch = note_ids[start:start + 500]
+            placeholders = ', '.join('?' * len(batch))
+            for nid, mid in mw.col.db.all(f"select id, mid from notes where id in ({placeholders})", *batch):
+                notetype = mw.col.models.get(mid)
+                if notetype:
+                    for field in notetype['flds']:
+                        names[(nid, field['ord'])] = field['name']
+        return names
+
+
+def open_audit_dialog():
+    dialog = AuditDialog(mw)
+    dialog.show()
+    dialog.run()
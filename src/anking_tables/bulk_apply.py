@@ -0,0 +1,145 @@
+from itertools import groupby
+
+from bs4 import BeautifulSoup
+
+from .locate import table_spans, splice_tables
+from .canonical import cluster_key
+from .log import get_logger, timer
+
+try:
+    from anki.errors import NotFoundError
+except ImportError:
+    # Without Anki, e.g. in the benchmark, collections raise KeyError for unknown notes
+    NotFoundError = KeyError
+
+logger = get_logger("bulk_apply")
+
+# Number of notes written per update_notes call
+BATCH_SIZE = 200
+
+# Report progress every this many notes
+PROGRESS_INTERVAL = 25
+
+UNDO_ENTRY_NAME = "Apply Table to All"
+
+
+class ApplyToAllResult:
+    """Counts of an Apply to All run."""
+
+    def __init__(self):
+        self.examined = 0
+        self.matched = 0
+        self.changed = 0
+        self.updated_note_ids = []
+        self.missing_note_ids = []
+        self.cancelled = False
+        # OpChanges of the undo entry, set once notes have been written
+        self.changes = None
+
+    def summary(self):
+        text = f"Examined {self.examined} notes, {self.matched} matched, {self.changed} changed."
+        if self.cancelled:
+            text += " Cancelled before all notes were examined."
+        return text
+
+
+def replace_matching_tables(field_html, replacements):
+    """Replace every top-level table in a field whose cluster key is in replacements with the HTML it maps to.
+
+    Only the table substrings are parsed, and the HTML around the replaced tables is left byte-identical. Returns the
+    new field HTML and whether any table matched.
+    """
+    spans = table_spans(field_html)
+    updated = {}
+    for position, (start, end) in enumerate(spans):
+        updated_html = replacements.get(cluster_key(BeautifulSoup(field_html[start:end], "html.parser").table))
+        if updated_html is not None:
+            updated[position] = updated_html
+    if not updated:
+        return field_html, False
+    return splice_tables(field_html, spans, updated), True
+
+
+def apply_to_all(col, index, replacements, progress=None, want_cancel=None, batch_size=BATCH_SIZE):
+    """Replace every copy of some tables in every note of the collection.
+
+    replacements maps the cluster key of each original table to its new HTML. Copies are matched by cluster key, so
+    every copy of a table is replaced whatever its formatting.
+
+    Modified notes are written in batches of update_notes calls that are merged into a single undo entry. progress is
+    called with (done, total) and want_cancel is polled between notes; both run on the calling thread. Notes examined
+    before a cancel are still written, under the same undo entry.
+    """
+    result = ApplyToAllResult()
+    # The replacements are stored as the parser serializes them, parsed once for all notes
+    replacements = {key: str(BeautifulSoup(updated_html, "html.parser")) for key, updated_html in replacements.items()}
+
+    # Bring the table index up to date and look up the fields that contain the tables
+    with timer("index sync", logger):
+        index.sync(col)
+    matched_fields = index.lookup_clusters(replacements)
+    logger.debug("Found %d fields that contain the original tables", len(matched_fields))
+    notes_to_check = [(note_id, [field_idx for _, field_idx in matches])
+                      for note_id, matches in groupby(matched_fields, key=lambda match: match[0])]
+    total = len(notes_to_check)
+
+    undo_entry = None
+    pending = []
+
+    def commit():
+        nonlocal undo_entry
+        if undo_entry is None:
+            undo_entry = col.add_custom_undo_entry(UNDO_ENTRY_NAME)
+        with timer("save", logger):
+            col.update_notes(pending)
+        logger.debug("Saved a batch of %d notes", len(pending))
+        pending.clear()
+
+    for done, (note_id, field_idxs) in enumerate(notes_to_check):
+        if want_cancel and want_cancel():
+            result.cancelled = True
+            break
+        if progress and done % PROGRESS_INTERVAL == 0:
+            progress(done, total)
+
+        try:
+            note = col.get_note(note_id)
+        except NotFoundError:
+            # The note was deleted since the last index sync
+            result.missing_note_ids.append(note_id)
+            continue
+        result.examined += 1
+
+        note_matched = False
+        note_changed = False
+        for field_idx in field_idxs:
+            if field_idx >= len(note.fields):
+                continue
+            old_html = note.fields[field_idx]
+            new_html, matched = replace_matching_tables(old_html, replacements)
+            note_matched = note_matched or matched
+            if new_html != old_html:
+                note.fields[field_idx] = new_html
+                note_changed = True
+
+        if note_matched:
+            result.matched += 1
+        if note_changed:
+            result.changed += 1
+            result.updated_note_ids.append(note_id)
+            pending.append(note)
+            if len(pending) >= batch_size:
+                commit()
+
+    if pending:
+        commit()
+    if progress:
+        progress(total, total)
+
+    # Notes deleted since the last sync are dropped from the index
+    if result.missing_note_ids:
+        index.forget_notes(result.missing_note_ids)
+
+    if undo_entry is not None:
+        result.changes = col.merge_undo_entries(undo_entry)
+    return result
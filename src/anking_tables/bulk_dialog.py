@@ -0,0 +1,108 @@
+import threading
+
+import aqt
+from anki.collection import OpChanges
+from aqt import mw
+from aqt.operations import CollectionOp, QueryOp
+from aqt.utils import showInfo, showWarning
+
+try:
+    from PyQt6.QtWidgets import QDialog, QVBoxLayout, QHBoxLayout, QFormLayout, QLineEdit, QComboBox, QCheckBox, \
+        QPushButton, QProgressDialog
+except (ImportError, AttributeError):
+    from PyQt5.QtWidgets import QDialog, QVBoxLayout, QHBoxLayout, QFormLayout, QLineEdit, QComboBox, QCheckBox, \
+        QPushButton, QProgressDialog
+
+from .bulk_normalize import normalize_notes
+from .log import get_logger
+from .utils import get_config
+
+logger = get_logger("bulk_dialog")
+
+
+class BulkNormalizeDialog(QDialog):
+    """Normalizes every table in the notes matching a search, with a dry run to preview the number of changes."""
+
+    def __init__(self, parent=None):
+        super().__init__(parent or mw)
+        self.setWindowTitle("Normalize Tables")
+
+        self.query_edit = QLineEdit("deck:current")
+        self.query_edit.setToolTip("Browser search for the notes whose tables should be normalized")
+
+        self.mode_combo = QComboBox()
+        self.mode_combo.addItem("Header row only", False)
+        self.mode_combo.addItem("Header row & column", True)
+
+        self.dry_run_check = QCheckBox("Dry run (only count the tables that would change)")
+        self.dry_run_check.setChecked(True)
+
+        form = QFormLayout()
+        form.addRow("Search", self.query_edit)
+        form.addRow("Format", self.mode_combo)
+
+        run_button = QPushButton("Run")
+        run_button.clicked.connect(self.run)
+        cancel_button = QPushButton("Close")
+        cancel_button.clicked.connect(self.close)
+        buttons = QHBoxLayout()
+        buttons.addStretch(1)
+        buttons.addWidget(run_button)
+        buttons.addWidget(cancel_button)
+
+        layout = QVBoxLayout(self)
+        layout.addLayout(form)
+        layout.addWidget(self.dry_run_check)
+        layout.addLayout(buttons)
+
+    def run(self):
+        query = self.query_edit.text()
+        header_column = self.mode_combo.currentData()
+        dry_run = self.dry_run_check.isChecked()
+        workers = get_config().get("bulk_normalize_workers")
+
+        progress_dialog = QProgressDialog("Normalizing tables...", "Cancel", 0, 0, self)
+        progress_dialog.setWindowTitle("Normalize Tables")
+        progress_dialog.setMinimumDuration(0)
+        cancel_requested = threading.Event()
+        progress_dialog.canceled.connect(cancel_requested.set)
+        progress_dialog.show()
+
+        def update_progress(done, total):
+            def update():
+                progress_dialog.setMaximum(total)
+                progress_dialog.setValue(done)
+                progress_dialog.setLabelText(f"Normalizing tables... {done}/{total} notes")
+            mw.taskman.run_on_main(update)
+
+        def op(col):
+            report = normalize_notes(col, query, header_column, dry_run=dry_run, workers=workers,
+                                     progress=update_progress, want_cancel=cancel_requested.is_set)
+            if report.changes is None:
+                report.changes = OpChanges()
+            return report
+
+        def on_success(report):
+            progress_dialog.close()
+            showInfo(report.summary(), parent=self, title="Normalize Tables")
+            if report.updated_note_ids:
+                # Create a filtered browser view with only the updated notes
+                browser = aqt.dialogs.open("Browser", mw)
+                browser.form.searchEdit.lineEdit().setText("nid:" + ",".join(map(str, report.updated_note_ids)))
+                browser.onSearchActivated()
+
+        def on_failure(error):
+            progress_dialog.close()
+            logger.error("Normalize Tables failed: %s", error)
+            showWarning(f"Normalize Tables failed: {error}", parent=self)
+
+        if dry_run:
+            # Nothing is written, so the collection is only read
+            QueryOp(parent=self, op=op, success=on_success).failure(on_failure).run_in_background()
+        else:
+            CollectionOp(parent=self, op=op).success(on_success).failure(on_failure).run_in_background()
+
+
+def open_bulk_normalize_dialog():
+    dialog = BulkNormalizeDialog(mw)
+    dialog.show()
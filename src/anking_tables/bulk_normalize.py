@@ -0,0 +1,152 @@
+import multiprocessing
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from .log import get_logger, timer
+from .normalize import normalize_field
+from .scanner import table_fields
+
+logger = get_logger("bulk_normalize")
+
+# Number of notes read from the collection, and written back, at a time
+BATCH_SIZE = 200
+
+# Fields handed to a worker process at a time
+WORKER_CHUNK_SIZE = 16
+
+UNDO_ENTRY_NAME = "Normalize Tables"
+
+
+class NormalizeReport:
+    """Counts of a bulk normalize run."""
+
+    def __init__(self, dry_run):
+        self.dry_run = dry_run
+        self.notes_examined = 0
+        self.notes_changed = 0
+        self.tables_examined = 0
+        self.tables_changed = 0
+        self.updated_note_ids = []
+        self.cancelled = False
+        # OpChanges of the undo entry, set once notes have been written
+        self.changes = None
+
+    def summary(self):
+        verb = "would change" if self.dry_run else "changed"
+        text = (f"Examined {self.tables_examined} tables in {self.notes_examined} notes: {self.tables_changed} tables "
+                f"in {self.notes_changed} notes {verb}.")
+        if self.cancelled:
+            text += " Cancelled before all notes were examined."
+        return text
+
+
+def default_workers():
+    """Return the number of worker processes when the config sets none: 1, worker processes are opt-in."""
+    return 1
+
+
+def process_pool(workers):
+    """Return a process pool of the given number of workers, or None when the work should stay in this process.
+
+    The pool uses the spawn start method on every platform, as forking Anki's process with its Qt threads is unsafe.
+    Spawned workers run sys.executable, so no pool is made when that is not a Python interpreter, like in the
+    packaged Anki builds where it is the Anki binary itself.
+    """
+    if workers <= 1:
+        return None
+    executable = os.path.basename(sys.executable or '').lower()
+    if getattr(sys, 'frozen', False) or not executable.startswith('python'):
+        logger.warning("%s is not a Python interpreter, working in this process instead of %d workers",
+                       sys.executable, workers)
+        return None
+    try:
+        return ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn'))
+    except (OSError, NotImplementedError) as error:
+        logger.warning("Could not start the worker processes, working in this process: %s", error)
+        return None
+
+
+def _normalize_field_task(task):
+    # Runs in the worker processes, so it only takes and returns plain strings and numbers
+    note_id, field_idx, field_html, header_column = task
+    new_html, tables, changed = normalize_field(field_html, header_column)
+    return note_id, field_idx, (new_html if changed else None), tables, changed
+
+
+def normalize_notes(col, query, header_column, dry_run=True, workers=None, progress=None, want_cancel=None,
+                    batch_size=BATCH_SIZE):
+    """Apply the table format to every table in the notes matching a search.
+
+    header_column=False gives tables with a header row only, True a header row and column, like the toolbar buttons.
+    Notes are read in batches and their fields normalized in a process pool of the given number of workers (1 or 0
+    normalizes in this process). With dry_run nothing is written and the report tells how many tables would change;
+    otherwise the changed notes are written in batches merged into a single undo entry. progress is called with
+    (done, total) and want_cancel is polled between batches.
+    """
+    report = NormalizeReport(dry_run)
+    note_ids = list(col.find_notes(query))
+    total = len(note_ids)
+    workers = default_workers() if workers is None else workers
+    logger.info("Normalizing tables in %d notes matching %r with %d workers", total, query, workers)
+
+    executor = process_pool(workers)
+
+    undo_entry = None
+    try:
+        for start in range(0, total, batch_size):
+            if want_cancel and want_cancel():
+                report.cancelled = True
+                break
+            if progress:
+                progress(start, total)
+
+            batch_ids = note_ids[start:start + batch_size]
+            tasks = [(note_id, field_idx, field_html, header_column)
+                     for note_id, _, field_idx, field_html in table_fields(col, note_ids=batch_ids)]
+            with timer("normalize batch", logger):
+                results = None
+                if executor is not None:
+                    try:
+                        results = list(executor.map(_normalize_field_task, tasks, chunksize=WORKER_CHUNK_SIZE))
+                    except BrokenProcessPool as error:
+                        logger.warning("Worker processes failed, normalizing in this process: %s", error)
+                        executor.shutdown(cancel_futures=True)
+                        executor = None
+                if results is None:
+                    results = [_normalize_field_task(task) for task in tasks]
+
+            report.notes_examined += len({task[0] for task in tasks})
+            changed_fields = {}
+            for note_id, field_idx, new_html, tables, changed in results:
+                report.tables_examined += tables
+                report.tables_changed += changed
+                if new_html is not None:
+                    changed_fields.setdefault(note_id, []).append((field_idx, new_html))
+            report.notes_changed += len(changed_fields)
+
+            if dry_run or not changed_fields:
+                continue
+
+            notes = []
+            for note_id, fields in changed_fields.items():
+                note = col.get_note(note_id)
+                for field_idx, new_html in fields:
+                    note.fields[field_idx] = new_html
+                notes.append(note)
+            if undo_entry is None:
+                undo_entry = col.add_custom_undo_entry(UNDO_ENTRY_NAME)
+            with timer("save", logger):
+                col.update_notes(notes)
+            report.updated_note_ids.extend(changed_fields)
+    finally:
+        if executor is not None:
+            executor.shutdown()
+
+    if progress:
+        progress(total, total)
+    if undo_entry is not None:
+        report.changes = col.merge_undo_entries(undo_entry)
+    logger.info("Normalize Tables: %s", report.summary())
+    return report
@@ -0,0 +1,128 @@
+import hashlib
+import re
+
+from bs4 import BeautifulSoup, NavigableString
+
+# Canonical form of a table, the identity used to find copies of it:
+#
+# - Section tags (<tbody>, <thead>, <tfoot>) are dropped, their rows are kept in order.
+# - Whitespace: runs of spaces, tabs and newlines in text become one space. Text that is only whitespace is dropped
+#   between the layout tags (<table>, sections, <tr>), where it is not rendered, and kept as one space anywhere else,
+#   so <b>a</b> <i>b</i> and <b>a</b><i>b</i> differ. Whitespace next to a cell or row is dropped too: the parser
+#   nests a cell whose end tag was left out around the next one, while browsers close it and ignore the whitespace. A non-breaking space is not whitespace, it is written as &nbsp;.
+# - Attributes are written in name order as name="value". Class lists are joined with single spaces, rowspan and
+#   colspan of 1 are dropped as they are the default.
+# - Entities: text and values are compared decoded, then written with only &amp; &lt; &gt; &quot; and &nbsp;
+#   escaped, so &#39;, &apos; and ' are the same.
+# - Void elements (<br>, <img>, ...) are written as <br> with no end tag whatever form they had.
+# - Comments, processing instructions and declarations are dropped.
+#
+# Tag and attribute names are lowercase already, the parser lowercases them.
+
+VOID_ELEMENTS = frozenset(['area', 'base', 'br', 'col', 'embed', 'hr', 'img', 'input', 'link', 'meta', 'param',
+                           'source', 'track', 'wbr'])
+
+SECTION_TAGS = frozenset(['tbody', 'thead', 'tfoot'])
+
+SPAN_ATTRIBUTES = frozenset(['rowspan', 'colspan'])
+
+# Elements whose whitespace-only text is not rendered
+LAYOUT_TAGS = frozenset(['table', 'tbody', 'thead', 'tfoot', 'tr', 'colgroup'])
+
+# Elements whose whitespace-only siblings are not rendered, whatever element the parser put them in
+BOUNDARY_TAGS = frozenset(['tr', 'td', 'th'])
+
+# Attributes that change what a table shows, the only ones in the cluster key
+CLUSTER_ATTRIBUTES = frozenset(['rowspan', 'colspan', 'src', 'href'])
+
+_SPACE = re.compile(r'[ \t\n\r\f]+')
+
+
+def _escape_text(text):
+    return text.replace('&', '&amp;').replace('<', '&lt;').replace('>', '&gt;').replace('\xa0', '&nbsp;')
+
+
+def _escape_value(value):
+    return _escape_text(value).replace('"', '&quot;')
+
+
+def canonical_tokens(table, attributes=None, strip_text=False):
+    """Yield the canonical form of a table element in pieces, in one walk over the tree.
+
+    attributes limits the attributes written to the given names, strip_text also trims the text of each text node,
+    which drops whitespace-only text everywhere.
+    """
+    stack = [table]
+    while stack:
+        node = stack.pop()
+        node_type = type(node)
+        if node_type is str:
+            # End tag, pushed below the children of its element
+            yield node
+            continue
+        if node_type is NavigableString:
+            text = _SPACE.sub(' ', node)
+            if strip_text:
+                text = text.strip(' ')
+            elif text == ' ' and (node.parent is not None and node.parent.name in LAYOUT_TAGS
+                                  or getattr(node.previous_sibling, 'name', None) in BOUNDARY_TAGS
+                                  or getattr(node.next_sibling, 'name', None) in BOUNDARY_TAGS):
+                continue
+            if text:
+                yield _escape_text(text)
+            continue
+        name = node.name
+        if name is None:
+            # Comment, processing instruction or declaration
+            continue
+        if name not in SECTION_TAGS:
+            parts = [name]
+            for key in sorted(node.attrs):
+                if attributes is not None and key not in attributes:
+                    continue
+                value = node.attrs[key]
+                value = ' '.join(value) if isinstance(value, list) else value.strip()
+                if key in SPAN_ATTRIBUTES and value == '1':
+                    continue
+                parts.append(f'{key}="{_escape_value(value)}"')
+            yield '<' + ' '.join(parts) + '>'
+            if name in VOID_ELEMENTS:
+                continue
+            stack.append(f'</{name}>')
+        stack.extend(reversed(node.contents))
+
+
+def _hash(tokens):
+    digest = hashlib.blake2b(digest_size=16)
+    for token in tokens:
+        digest.update(token.encode('utf-8'))
+    return digest.hexdigest()
+
+
+def _as_table(table):
+    return BeautifulSoup(table, 'html.parser').table if isinstance(table, str) else table
+
+
+def canonical_html(table):
+    """Return the canonical form of a table element (or table HTML) as HTML, see the rules above."""
+    table = _as_table(table)
+    return ''.join(canonical_tokens(table)) if table is not None else ''
+
+
+def table_fingerprint(table):
+    """Return the hash of the canonical form of a table element (or table HTML), the identity of exact copies.
+
+    The hash is fed while the tree is walked, the canonical HTML is never built.
+    """
+    table = _as_table(table)
+    return _hash(canonical_tokens(table) if table is not None else ())
+
+
+def cluster_key(table):
+    """Return the key of a table's cluster: copies of a table that only differ in formatting share it.
+
+    Like the fingerprint, but only the CLUSTER_ATTRIBUTES are kept and the text of each text node is trimmed, so a
+    copy with different styles, classes or spacing lands in the same cluster.
+    """
+    table = _as_table(table)
+    return _hash(canonical_tokens(table, CLUSTER_ATTRIBUTES, strip_text=True) if table is not None else ())
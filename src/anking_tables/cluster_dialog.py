@@ -0,0 +1,111 @@
+from anki.errors import NotFoundError
+from aqt import mw
+from aqt.operations import QueryOp
+from aqt.utils import showWarning, tooltip
+
+try:
+    from PyQt6.QtWidgets import QDialog, QVBoxLayout, QHBoxLayout, QLabel, QListWidget, QPushButton
+except (ImportError, AttributeError):
+    from PyQt5.QtWidgets import QDialog, QVBoxLayout, QHBoxLayout, QLabel, QListWidget, QPushButton
+
+from .bulk_normalize import default_workers
+from .clusters import find_clusters
+from .log import get_logger
+from .main_window import HtmlViewer
+from .utils import get_table_index, search_text, get_config
+
+logger = get_logger("cluster_dialog")
+
+
+class ClusterDialog(QDialog):
+    """Lists the tables that are copied across notes, grouped by cluster, and opens a cluster for one edit."""
+
+    def __init__(self, parent=None):
+        super().__init__(parent or mw)
+        self.setWindowTitle("Duplicate Tables")
+        self.setMinimumWidth(520)
+        self.report = None
+        self.viewer = None
+
+        self.summary_label = QLabel("Finding duplicate tables...")
+        self.summary_label.setWordWrap(True)
+        self.cluster_list = QListWidget()
+        self.cluster_list.itemDoubleClicked.connect(self.edit_cluster)
+
+        browse_button = QPushButton("Browse")
+        browse_button.setToolTip("Open the notes of the selected cluster in the Browser")
+        browse_button.clicked.connect(self.browse)
+        edit_button = QPushButton("Edit Cluster...")
+        edit_button.setToolTip("Edit the table once and apply it to every copy with Apply to All")
+        edit_button.clicked.connect(self.edit_cluster)
+        rerun_button = QPushButton("Re-run")
+        rerun_button.clicked.connect(self.run)
+        close_button = QPushButton("Close")
+        close_button.clicked.connect(self.close)
+        buttons = QHBoxLayout()
+        buttons.addWidget(browse_button)
+        buttons.addWidget(edit_button)
+        buttons.addStretch(1)
+        buttons.addWidget(rerun_button)
+        buttons.addWidget(close_button)
+
+        layout = QVBoxLayout(self)
+        layout.addWidget(self.summary_label)
+        layout.addWidget(self.cluster_list)
+        layout.addLayout(buttons)
+
+    def run(self):
+        self.summary_label.setText("Finding duplicate tables...")
+
+        def on_failure(error):
+            logger.error("Finding duplicate tables failed: %s", error)
+            showWarning(f"Finding duplicate tables failed: {error}", parent=self)
+
+        workers = get_config().get("bulk_normalize_workers")
+        workers = default_workers() if workers is None else workers
+        QueryOp(parent=self, op=lambda col: find_clusters(col, get_table_index(), workers),
+                success=self.show_report).failure(on_failure).with_progress("Finding duplicate tables...") \
+            .run_in_background()
+
+    def show_report(self, report):
+        self.report = report
+        self.summary_label.setText(report.summary())
+        self.cluster_list.clear()
+        for cluster in report.clusters:
+            self.cluster_list.addItem(f"{cluster.tables} tables in {len(cluster.note_ids())} notes: "
+                                      f"{cluster.preview or '(no text)'}")
+        if report.clusters:
+            self.cluster_list.setCurrentRow(0)
+
+    def current_cluster(self):
+        if self.report is None or self.cluster_list.currentRow() < 0:
+            return None
+        return self.report.clusters[self.cluster_list.currentRow()]
+
+    def browse(self, *args):
+        cluster = self.current_cluster()
+        if cluster is not None:
+            search_text("nid:" + ",".join(map(str, cluster.note_ids())))
+
+    def edit_cluster(self, *args):
+        cluster = self.current_cluster()
+        if cluster is None:
+            return
+        note_id, field_idx, _ = cluster.members[0]
+        try:
+            note = mw.col.get_note(note_id)
+        except NotFoundError:
+            tooltip("The note was deleted, re-run to refresh the clusters", parent=self)
+            return
+        field_name = note.note_type()['flds'][field_idx]['name']
+
+        # The viewer is kept here, it has no editor to hold on to it
+        self.viewer = HtmlViewer(note.fields[field_idx], None, mw, mw.col, None, field_name, note_id,
+                                 cluster=cluster.key)
+        self.viewer.show()
+
+
+def open_cluster_dialog():
+    dialog = ClusterDialog(mw)
+    dialog.show()
+    dialog.run()
@@ -0,0 +1,89 @@
+import html
+import re
+
+from .locate import table_spans
+from .log import get_logger, timer
+from .scanner import FIELD_SEPARATOR
+
+logger = get_logger("clusters")
+
+# Clusters listed in a report, the largest ones; the rest only count towards the totals
+MAX_LISTED_CLUSTERS = 500
+
+# Characters of table text shown for a cluster
+PREVIEW_LENGTH = 80
+
+_TAG = re.compile(r'<[^>]*>')
+_WHITESPACE = re.compile(r'\s+')
+
+
+class TableCluster:
+    """Tables of the collection that are copies of each other, see canonical.cluster_key."""
+
+    __slots__ = ('key', 'members', 'preview')
+
+    def __init__(self, key, members, preview=''):
+        self.key = key
+        # (note id, field index, table position) of every table of the cluster
+        self.members = members
+        self.preview = preview
+
+    @property
+    def tables(self):
+        return len(self.members)
+
+    def note_ids(self):
+        return sorted({nid for nid, _, _ in self.members})
+
+
+class ClusterReport:
+    """The duplicated tables of the collection, largest cluster first."""
+
+    def __init__(self, clusters, counts):
+        # The largest clusters with their members
+        self.clusters = clusters
+        # (tables, notes) of every cluster, including those beyond the listed ones
+        self.counts = counts
+
+    def summary(self):
+        tables = sum(count for count, _ in self.counts)
+        text = f"{tables} tables are copies of another table, in {len(self.counts)} clusters."
+        if len(self.clusters) < len(self.counts):
+            text += f" Showing the {len(self.clusters)} largest."
+        return text
+
+
+def table_preview(col, nid, field_idx, position):
+    """Return the start of the text of a table, read from its note without parsing."""
+    flds = col.db.scalar("select flds from notes where id = ?", nid)
+    if flds is None:
+        return ''
+    fields = flds.split(FIELD_SEPARATOR)
+    if field_idx >= len(fields):
+        return ''
+    spans = table_spans(fields[field_idx])
+    if position >= len(spans):
+        return ''
+    start, end = spans[position]
+    text = _WHITESPACE.sub(' ', html.unescape(_TAG.sub(' ', fields[field_idx][start:end]))).strip()
+    return text[:PREVIEW_LENGTH]
+
+
+def find_clusters(col, index, workers=1, min_tables=2, max_listed=MAX_LISTED_CLUSTERS):
+    """Bring the table index up to date and group the tables of the collection by cluster key.
+
+    The grouping is a single query over the cluster keys stored in the index, so only notes modified since the last
+    sync are parsed. The sync drops the tables of deleted notes, so the clusters only hold tables of existing notes.
+    """
+    with timer("cluster sync", logger):
+        index.sync(col, workers=workers)
+
+    with timer("cluster grouping", logger):
+        rows = index.clusters(min_tables)
+    clusters = []
+    for key, _, _ in rows[:max_listed]:
+        members = index.cluster_members(key)
+        clusters.append(TableCluster(key, members, table_preview(col, *members[0])))
+    report = ClusterReport(clusters, [(tables, notes) for _, tables, notes in rows])
+    logger.info("Clusters: %s", report.summary())
+    return report
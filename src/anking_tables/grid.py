@@ -0,0 +1,228 @@
+from bs4 import Tag
+
+EMPTY = -1
+
+# Largest spans, the limits of the HTML parsing rules that browsers clamp to
+MAX_SPANS = {'rowspan': 65534, 'colspan': 1000}
+
+
+def span_value(value, name):
+    """Return a rowspan/colspan attribute value as an int, 1 when missing or invalid and clamped like browsers do."""
+    try:
+        value = int(value or 1)
+    except (TypeError, ValueError):
+        return 1
+    return min(value, MAX_SPANS[name]) if value >= 0 else 1
+
+
+def _span(cell, name):
+    """Return a cell's rowspan/colspan as an int, see span_value."""
+    return span_value(cell.get(name), name)
+
+
+class GridCell:
+    """A cell of a table grid and the slots it occupies."""
+
+    __slots__ = ('element', 'row', 'col', 'rowspan', 'colspan')
+
+    def __init__(self, element, row, col, rowspan, colspan):
+        self.element = element
+        self.row = row
+        self.col = col
+        self.rowspan = rowspan
+        self.colspan = colspan
+
+    @property
+    def name(self):
+        return self.element.name
+
+    def __repr__(self):
+        return f"GridCell({self.element.name}, row={self.row}, col={self.col}, {self.rowspan}x{self.colspan})"
+
+
+class TableGrid:
+    """Resolved layout of a table: every cell with the rows and columns it covers.
+
+    cells is a flat list in document order, row_starts[r] is the index of the first cell that starts in row r, and
+    slots is a row-major array of height * width cell indexes (EMPTY for holes in ragged tables). The grid is built
+    in one pass over the rows with the HTML table rules for rowspan and colspan, so it is correct for arbitrary spans.
+    """
+
+    def __init__(self, rows, row_cells):
+        # rows: the table's own <tr> elements, row_cells: the <td>/<th> elements of each of those rows
+        self.rows = list(rows)
+        self.cells = []
+        self.row_starts = []
+        self.height = len(self.rows)
+        self.width = 0
+        self.slots = []
+        self._build(row_cells)
+
+    @classmethod
+    def from_table(cls, table):
+        """Build the grid of a table element without modifying it."""
+        rows = []
+        row_cells = []
+        for row in _own_rows(table):
+            rows.append(row)
+            row_cells.append([cell for cell in row.find_all(['td', 'th'], recursive=False)])
+        return cls(rows, row_cells)
+
+    def _build(self, row_cells):
+        height = self.height
+        # Columns still covered by rowspans from earlier rows, per row
+        covered = [set() for _ in range(height)]
+        cells = self.cells
+        width = 0
+        for r, elements in enumerate(row_cells):
+            self.row_starts.append(len(cells))
+            col = 0
+            taken = covered[r]
+            for element in elements:
+                while col in taken:
+                    col += 1
+                rowspan = _span(element, 'rowspan')
+                colspan = _span(element, 'colspan') or 1
+                # rowspan="0" spans to the end of the table, and no span reaches past the last row
+                if rowspan == 0 or r + rowspan > height:
+                    rowspan = height - r
+                cells.append(GridCell(element, r, col, rowspan, colspan))
+                for covered_row in range(r + 1, r + rowspan):
+                    covered[covered_row].update(range(col, col + colspan))
+                col += colspan
+            width = max(width, col, max(taken) + 1 if taken else 0)
+        self.row_starts.append(len(cells))
+        self.width = width
+
+        slots = [EMPTY] * (height * width)
+        for index, cell in enumerate(cells):
+            for r in range(cell.row, cell.row + cell.rowspan):
+                base = r * width
+                for c in range(cell.col, cell.col + cell.colspan):
+                    slots[base + c] = index
+        self.slots = slots
+
+    def row_cells(self, row):
+        """Return the cells that start in a row."""
+        return self.cells[self.row_starts[row]:self.row_starts[row + 1]]
+
+    def cell_at(self, row, col):
+        """Return the cell covering a slot, or None for a hole."""
+        if not (0 <= row < self.height and 0 <= col < self.width):
+            return None
+        index = self.slots[row * self.width + col]
+        return self.cells[index] if index != EMPTY else None
+
+    def first_cell(self, row):
+        """Return the first cell that starts in a row, or None."""
+        start, end = self.row_starts[row], self.row_starts[row + 1]
+        return self.cells[start] if start < end else None
+
+    def is_merged_row(self, row):
+        """Return whether a row is a single cell merged across the whole table."""
+        cells = self.row_cells(row)
+        return (len(cells) == 1 and cells[0].colspan > 1 and cells[0].col == 0
+                and cells[0].colspan >= self.width)
+
+    def starts_in_column(self, row, col=0):
+        """Return whether the slot is covered by a cell that starts in that row (and not by a rowspan from above)."""
+        cell = self.cell_at(row, col)
+        return cell is not None and cell.row == row
+
+    # Structural edits change the table element and rebuild the grid, both in time linear in the number of cells
+
+    def rebuild(self):
+        rows = []
+        row_cells = []
+        table = self.rows[0].find_parent('table') if self.rows else None
+        if table is not None:
+            for row in _own_rows(table):
+                rows.append(row)
+                row_cells.append(row.find_all(['td', 'th'], recursive=False))
+        self.__init__(rows, row_cells)
+
+    def insert_row(self, index):
+        """Insert an empty row before row index (at the end when index == height)."""
+        if not self.rows:
+            raise ValueError("Cannot insert a row into a table without rows")
+        new_row = Tag(name='tr')
+        for col in range(self.width):
+            above = self.cell_at(index - 1, col) if index > 0 else None
+            if above is not None and above.row + above.rowspan > index:
+                # A rowspan crossing the new row grows instead of getting a new cell
+                if above.col == col:
+                    above.rowspan += 1
+                    above.element['rowspan'] = str(above.rowspan)
+                continue
+            new_row.append(Tag(name='td'))
+        if index < self.height:
+            self.rows[index].insert_before(new_row)
+        else:
+            self.rows[-1].insert_after(new_row)
+        self.rebuild()
+        return new_row
+
+    def insert_column(self, index):
+        """Insert an empty column before column index (at the end when index == width)."""
+        for row in range(self.height):
+            left = self.cell_at(row, index - 1) if index > 0 else None
+            if left is not None and left.col + left.colspan > index:
+                # A colspan crossing the new column grows instead of getting a new cell
+                if left.row == row:
+                    left.colspan += 1
+                    left.element['colspan'] = str(left.colspan)
+                continue
+            new_cell = Tag(name='td')
+            following = [cell for cell in self.row_cells(row) if cell.col >= index]
+            if following:
+                following[0].element.insert_before(new_cell)
+            else:
+                self.rows[row].append(new_cell)
+        self.rebuild()
+
+    def merge_cells(self, top, left, bottom, right):
+        """Merge the cells in the rectangle (inclusive) into its top-left cell.
+
+        The contents of the other cells are appended to the top-left cell. Raises ValueError if a cell sticks out of
+        the rectangle.
+        """
+        merged = []
+        seen = set()
+        for row in range(top, bottom + 1):
+            for col in range(left, right + 1):
+                cell = self.cell_at(row, col)
+                if cell is None or id(cell) in seen:
+                    continue
+                if (cell.row < top or cell.col < left or cell.row + cell.rowspan - 1 > bottom
+                        or cell.col + cell.colspan - 1 > right):
+                    raise ValueError("The cells to merge do not form a rectangle")
+                seen.add(id(cell))
+                merged.append(cell)
+        if not merged:
+            raise ValueError("There are no cells to merge")
+
+        target = merged[0]
+        for cell in merged[1:]:
+            target.element.append(' ')
+            for child in list(cell.element.contents):
+                target.element.append(child.extract())
+            cell.element.decompose()
+        rowspan = bottom - top + 1
+        colspan = right - left + 1
+        for name, value in (('rowspan', rowspan), ('colspan', colspan)):
+            if value > 1:
+                target.element[name] = str(value)
+            elif name in target.element.attrs:
+                del target.element[name]
+        self.rebuild()
+        return target.element
+
+
+def _own_rows(table):
+    """Yield the rows of a table, without the rows of nested tables."""
+    for child in table.find_all(True, recursive=False):
+        if child.name == 'tr':
+            yield child
+        elif child.name in ('tbody', 'thead', 'tfoot'):
+            for row in child.find_all('tr', recursive=False):
+                yield row
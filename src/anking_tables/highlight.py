@@ -0,0 +1,127 @@
+import re
+
+# Tokenizer modes, carried from one line to the next in the block state
+TEXT = 0
+TAG = 1
+DOUBLE_QUOTED = 2
+SINGLE_QUOTED = 3
+COMMENT = 4
+
+MODE_BITS = 3
+MODE_MASK = (1 << MODE_BITS) - 1
+
+# Token types
+TAG_TOKEN = 'tag'
+ATTRIBUTE_TOKEN = 'attribute'
+VALUE_TOKEN = 'value'
+COMMENT_TOKEN = 'comment'
+ENTITY_TOKEN = 'entity'
+
+# Tag families, each one is colored differently
+TAG_FAMILIES = ('other', 'table', 'cell', 'format', 'list', 'media')
+_FAMILY_OF_TAG = {
+    'table': 'table', 'tbody': 'table', 'thead': 'table', 'tfoot': 'table', 'tr': 'table', 'caption': 'table',
+    'td': 'cell', 'th': 'cell',
+    'b': 'format', 'u': 'format', 'i': 'format', 'sub': 'format', 'sup': 'format', 'strong': 'format', 'em': 'format',
+    'ul': 'list', 'ol': 'list', 'li': 'list',
+    'img': 'media', 'a': 'media', 'br': 'media',
+}
+FAMILY_INDEX = {family: i for i, family in enumerate(TAG_FAMILIES)}
+
+_TEXT_RE = re.compile(r'<!--|<(/?)([A-Za-z][\w:-]*)|&(?:#\d+|#[xX][0-9a-fA-F]+|\w+);')
+_TAG_RE = re.compile(r'\s*(?:(/?>)|(=)\s*(["\']?)|([^\s=/>"\']+))')
+_UNQUOTED_VALUE_RE = re.compile(r'[^\s>"\']+')
+_COMMENT_END = '-->'
+
+
+def tag_family(name):
+    return _FAMILY_OF_TAG.get(name.lower(), 'other')
+
+
+def pack_state(mode, family):
+    return mode | (FAMILY_INDEX[family] << MODE_BITS)
+
+
+def unpack_state(state):
+    if state < 0:
+        return TEXT, 'other'
+    return state & MODE_MASK, TAG_FAMILIES[state >> MODE_BITS]
+
+
+def tokenize_line(text, state=-1):
+    """Split one line of HTML into (start, length, token type, tag family) tokens.
+
+    state is the state returned for the previous line (-1 for the first line), so tags, attribute values and
+    comments that continue over several lines keep their colors. Returns the tokens and the state at the end of the
+    line.
+    """
+    mode, family = unpack_state(state)
+    tokens = []
+    pos = 0
+    end = len(text)
+    while pos < end:
+        if mode == TEXT:
+            match = _TEXT_RE.search(text, pos)
+            if not match:
+                break
+            if match.group(0) == '<!--':
+                mode = COMMENT
+                pos = match.start()
+            elif match.group(2):
+                family = tag_family(match.group(2))
+                tokens.append((match.start(), match.end() - match.start(), TAG_TOKEN, family))
+                mode = TAG
+                pos = match.end()
+            else:
+                tokens.append((match.start(), match.end() - match.start(), ENTITY_TOKEN, family))
+                pos = match.end()
+
+        elif mode == COMMENT:
+            close = text.find(_COMMENT_END, pos)
+            stop = end if close < 0 else close + len(_COMMENT_END)
+            tokens.append((pos, stop - pos, COMMENT_TOKEN, family))
+            pos = stop
+            if close >= 0:
+                mode = TEXT
+
+        elif mode == TAG:
+            match = _TAG_RE.match(text, pos)
+            if not match or match.end() == pos:
+                # Stray character inside the tag
+                pos += 1
+                continue
+            if match.group(1):
+                tokens.append((match.start(1), len(match.group(1)), TAG_TOKEN, family))
+                mode = TEXT
+                pos = match.end()
+            elif match.group(2):
+                pos = match.end()
+                quote = match.group(3)
+                if quote:
+                    close = text.find(quote, pos)
+                    stop = end if close < 0 else close + 1
+                    tokens.append((pos - 1, stop - pos + 1, VALUE_TOKEN, family))
+                    if close < 0:
+                        # The value continues on the next line
+                        mode = DOUBLE_QUOTED if quote == '"' else SINGLE_QUOTED
+                    pos = stop
+                else:
+                    value = _UNQUOTED_VALUE_RE.match(text, pos)
+                    if value:
+                        tokens.append((value.start(), value.end() - value.start(), VALUE_TOKEN, family))
+                        pos = value.end()
+            else:
+                tokens.append((match.start(4), len(match.group(4)), ATTRIBUTE_TOKEN, family))
+                pos = match.end()
+
+        else:
+            # Continuation of a quoted attribute value from the previous line
+            close = text.find('"' if mode == DOUBLE_QUOTED else "'", pos)
+            stop = end if close < 0 else close + 1
+            tokens.append((pos, stop - pos, VALUE_TOKEN, family))
+            pos = stop
+            if close >= 0:
+                mode = TAG
+
+    return tokens, pack_state(mode, family)
+
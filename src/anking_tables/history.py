@@ -0,0 +1,176 @@
+import re
+from difflib import SequenceMatcher
+
+# Versions kept per session and the total size of their deltas in characters. The oldest versions are dropped first.
+MAX_VERSIONS = 200
+MAX_DELTA_LENGTH = 2_000_000
+
+# Diffs are computed on rows first, then on the tags and text of the rows that changed, which keeps them small on
+# single-line table HTML without comparing every tag of a large table with every other
+_ROW_RE = re.compile(r'(?=<tr[\s>])', re.IGNORECASE)
+_TOKEN_RE = re.compile(r'<[^>]*>?|[^<]+')
+
+# Changed runs with more tokens than this are stored whole instead of diffed further
+MAX_DIFF_TOKENS = 2000
+
+
+class Delta:
+    """Reversible difference between two texts: (old offset, new offset, old text, new text) per changed run."""
+
+    __slots__ = ('ops', 'length')
+
+    def __init__(self, ops):
+        self.ops = tuple(ops)
+        self.length = sum(len(old) + len(new) for _, _, old, new in self.ops)
+
+    @classmethod
+    def between(cls, old_text, new_text):
+        # Common prefix and suffix are cut off first, most edits touch a small part of the table
+        prefix = 0
+        limit = min(len(old_text), len(new_text))
+        while prefix < limit and old_text[prefix] == new_text[prefix]:
+            prefix += 1
+        suffix = 0
+        limit -= prefix
+        while suffix < limit and old_text[-1 - suffix] == new_text[-1 - suffix]:
+            suffix += 1
+        old_middle = old_text[prefix:len(old_text) - suffix]
+        new_middle = new_text[prefix:len(new_text) - suffix]
+        if not old_middle or not new_middle:
+            return cls([(prefix, prefix, old_middle, new_middle)] if old_middle or new_middle else [])
+
+        ops = []
+        _diff(_ROW_RE.split(old_middle), _ROW_RE.split(new_middle), prefix, prefix, ops, tokens=False)
+        return cls(ops)
+
+    def apply(self, text):
+        """Turn the old text into the new text."""
+        parts = []
+        last = 0
+        for old_start, _, old, new in self.ops:
+            parts.append(text[last:old_start])
+            parts.append(new)
+            last = old_start + len(old)
+        parts.append(text[last:])
+        return ''.join(parts)
+
+    def revert(self, text):
+        """Turn the new text back into the old text."""
+        parts = []
+        last = 0
+        for _, new_start, old, new in self.ops:
+            parts.append(text[last:new_start])
+            parts.append(old)
+            last = new_start + len(new)
+        parts.append(text[last:])
+        return ''.join(parts)
+
+
+def _offsets(chunks, start):
+    offsets = [start]
+    for chunk in chunks:
+        offsets.append(offsets[-1] + len(chunk))
+    return offsets
+
+
+def _diff(old_chunks, new_chunks, old_start, new_start, ops, tokens):
+    """Append the changed runs between two chunk lists to ops, diffing changed rows again by token."""
+    old_offsets = _offsets(old_chunks, old_start)
+    new_offsets = _offsets(new_chunks, new_start)
+    matcher = SequenceMatcher(None, old_chunks, new_chunks, autojunk=False)
+    for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+        if tag == 'equal':
+            continue
+        if not tokens and i2 - i1 == j2 - j1 > 1:
+            # A transform of every row (like the header buttons) is diffed row by row
+            for i, j in zip(range(i1, i2), range(j1, j2)):
+                _diff([old_chunks[i]], [new_chunks[j]], old_offsets[i], new_offsets[j], ops, tokens=False)
+            continue
+        old = ''.join(old_chunks[i1:i2])
+        new = ''.join(new_chunks[j1:j2])
+        if not tokens and old and new:
+            old_tokens = _TOKEN_RE.findall(old)
+            new_tokens = _TOKEN_RE.findall(new)
+            if len(old_tokens) <= MAX_DIFF_TOKENS and len(new_tokens) <= MAX_DIFF_TOKENS:
+                _diff(old_tokens, new_tokens, old_offsets[i1], new_offsets[j1], ops, tokens=True)
+                continue
+        ops.append((old_offsets[i1], new_offsets[j1], old, new))
+
+
+class EditHistory:
+    """Versions of the text of an editing session, stored as deltas from the previous version.
+
+    Only the current text is kept in full. Moving to another version applies or reverts the deltas in between, so
+    memory use grows with the size of the changes rather than with the number of versions times the table size.
+    Recording a version after moving back drops the versions after it, like an undo stack.
+    """
+
+    def __init__(self, text, label="Original", max_versions=MAX_VERSIONS, max_delta_length=MAX_DELTA_LENGTH):
+        self.text = text
+        self.max_versions = max_versions
+        self.max_delta_length = max_delta_length
+        # labels[i] names version i, deltas[i] turns version i into version i + 1
+        self.labels = [label]
+        self.deltas = []
+        self.current = 0
+        self.delta_length = 0
+        # Versions dropped from the start of the history
+        self.dropped = 0
+
+    def __len__(self):
+        return len(self.labels)
+
+    def record(self, text, label):
+        """Add text as a new version after the current one. Returns False if it is the current text."""
+        if text == self.text:
+            return False
+        # Branching off an earlier version drops the versions after it
+        for delta in self.deltas[self.current:]:
+            self.delta_length -= delta.length
+        del self.deltas[self.current:]
+        del self.labels[self.current + 1:]
+
+        delta = Delta.between(self.text, text)
+        self.deltas.append(delta)
+        self.labels.append(label)
+        self.delta_length += delta.length
+        self.text = text
+        self.current += 1
+
+        while len(self.labels) > self.max_versions or (self.delta_length > self.max_delta_length and self.deltas
+                                                       and self.current > 0):
+            self.delta_length -= self.deltas.pop(0).length
+            self.labels.pop(0)
+            self.current -= 1
+            self.dropped += 1
+        return True
+
+    def goto(self, version):
+        """Make version the current one and return its text."""
+        if not 0 <= version < len(self.labels):
+            raise IndexError(f"No version {version} in the history")
+        text = self.text
+        while self.current < version:
+            text = self.deltas[self.current].apply(text)
+            self.current += 1
+        while self.current > version:
+            self.current -= 1
+            text = self.deltas[self.current].revert(text)
+        self.text = text
+        return text
+
+    def can_undo(self):
+        return self.current > 0
+
+    def can_redo(self):
+        return self.current < len(self.labels) - 1
+
+    def undo(self):
+        return self.goto(self.current - 1)
+
+    def redo(self):
+        return self.goto(self.current + 1)
+
+    def entries(self):
+        """Return (version number, label) of every kept version, numbered from the start of the session."""
+        return [(self.dropped + i + 1, label) for i, label in enumerate(self.labels)]
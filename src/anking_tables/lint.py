@@ -0,0 +1,259 @@
+import html as html_module
+import re
+from bisect import bisect_left
+from collections import OrderedDict
+
+from .audit import CREDITS_TEXT
+from .grid import span_value
+from .locate import table_spans, inside_tag
+from .log import get_logger, timer
+from .normalize import TAG_WHITELIST
+
+logger = get_logger("lint")
+
+# Problem codes, in report order, with what is wrong
+LINT_RULES = {
+    'cells': 'Row does not fill the table width',
+    'overlap': 'Cells overlap',
+    'header': 'Header cell outside the header row and first column',
+    'tags': 'Tag outside the whitelist',
+    'credits': 'Photo credits inside the table',
+}
+
+_RULE_ORDER = {code: order for order, code in enumerate(LINT_RULES)}
+
+# Row results kept between runs, the rows of a few large tables
+MAX_CACHED_ROWS = 5000
+
+# Finds where the rows of a table start: only <table> and <tr> tags are looked at, with the skipping rules of the
+# locator for comments, script and style contents and quoted attribute values
+_ROW_TOKEN_RE = re.compile(r'<!--.*?(?:-->|\Z)'
+                           r'|<(script|style)\b.*?(?:</\1\s*>|\Z)'
+                           r'|<(/?)(table|tr)\b(?:[^>"\']|"[^"]*"|\'[^\']*\')*>?',
+                           re.IGNORECASE | re.DOTALL)
+
+# Every tag of a row. Script and style elements are one token, their contents are not HTML.
+_TAG_RE = re.compile(r'<!--.*?(?:-->|\Z)'
+                     r'|<(script|style)\b.*?(?:</\1\s*>|\Z)'
+                     r'|<(/?)([a-zA-Z][^\s/>]*)((?:[^>"\']|"[^"]*"|\'[^\']*\')*)>?',
+                     re.IGNORECASE | re.DOTALL)
+
+_SPAN_RE = re.compile(r'\b(rowspan|colspan)\s*=\s*(?:"([^"]*)"|\'([^\']*)\'|([^\s>]*))', re.IGNORECASE)
+
+_TEXT_TAG_RE = re.compile(r'<!--.*?(?:-->|\Z)|<(script|style)\b.*?(?:</\1\s*>|\Z)|<[^>]*>?',
+                          re.IGNORECASE | re.DOTALL)
+
+_ASTRAL_RE = re.compile('[\U00010000-\U0010ffff]')
+
+
+class LintProblem:
+    """A structural problem of a table in the editor, at start:end of the editor text."""
+
+    __slots__ = ('code', 'message', 'start', 'end', 'table', 'row')
+
+    def __init__(self, code, message, start, end, table, row):
+        self.code = code
+        self.message = message
+        self.start = start
+        self.end = end
+        # Position of the table in the text and of the row in the table, from 0. row is None before the first row.
+        self.table = table
+        self.row = row
+
+    def __repr__(self):
+        return f"LintProblem({self.code}, table={self.table}, row={self.row}, {self.start}:{self.end})"
+
+
+class _RowResult:
+    """What is known of one row from its own HTML: its cells, the tags normalizing removes and the credits."""
+
+    __slots__ = ('tag_end', 'cells', 'bad_tags', 'credits')
+
+    def __init__(self, tag_end, cells, bad_tags, credits):
+        # End of the row's start tag
+        self.tag_end = tag_end
+        # (name, rowspan, colspan, start, end) of the row's own cells, not those of nested tables
+        self.cells = cells
+        # (name, start, end) of every start tag outside the whitelist
+        self.bad_tags = bad_tags
+        # (start, end) of the photo credits, None when there are none
+        self.credits = credits
+
+
+def _check_row(html):
+    """Check the HTML of one row (or what comes before the first row of a table) on its own."""
+    tag_end = 0
+    cells = []
+    bad_tags = []
+    # Nested tables opened inside the row, whose cells are not the row's
+    depth = 0
+    for match in _TAG_RE.finditer(html):
+        script, closing, name, attributes = match.groups()
+        if script is not None:
+            bad_tags.append((script.lower(), match.start(), match.start() + 1 + len(script)))
+            continue
+        if name is None:
+            # Comment
+            continue
+        name = name.lower()
+        if closing:
+            if name == 'table' and depth:
+                depth -= 1
+            continue
+        if name not in TAG_WHITELIST:
+            bad_tags.append((name, match.start(), match.end()))
+        if name == 'tr' and not tag_end:
+            tag_end = match.end()
+        elif name == 'table':
+            depth += 1
+        elif name in ('td', 'th') and not depth:
+            spans = {'rowspan': 1, 'colspan': 1}
+            for span in _SPAN_RE.finditer(attributes):
+                attribute, double, single, bare = span.groups()
+                value = double if double is not None else single if single is not None else bare
+                attribute = attribute.lower()
+                spans[attribute] = span_value(value, attribute)
+            cells.append((name, spans['rowspan'], spans['colspan'] or 1, match.start(), match.end()))
+
+    credits = None
+    if 'credit' in html.lower():
+        text = html_module.unescape(_TEXT_TAG_RE.sub('', html))
+        if CREDITS_TEXT in text:
+            # Marked where it is written, or on the row when entities or tags split it in the HTML
+            start = html.find(CREDITS_TEXT.strip())
+            credits = (start, start + len(CREDITS_TEXT.strip())) if start >= 0 else (0, tag_end)
+    return _RowResult(tag_end, cells, bad_tags, credits)
+
+
+def _row_starts(html, start, end):
+    """Return the offsets of the <tr> tags of the table at html[start:end], not those of its nested tables."""
+    starts = []
+    depth = 0
+    for match in _ROW_TOKEN_RE.finditer(html, start, end):
+        name = match.group(3)
+        if name is None or html[match.start() - 1] != '>' and inside_tag(html, match.start()):
+            continue
+        if name.lower() == 'table':
+            depth += -1 if match.group(2) else 1
+        elif depth == 1 and not match.group(2):
+            starts.append(match.start())
+    return starts
+
+
+class TableLinter:
+    """Checks the structure of the tables in the editor while they are edited.
+
+    The text is split into rows with a regex scan, and each row is checked on its own and cached by its HTML, so a
+    run only re-checks the rows changed since the last one. The checks that span rows (widths, rowspan overlaps and
+    header positions) then run over the cached cells without parsing. Not thread-safe: one run at a time.
+    """
+
+    def __init__(self, max_rows=MAX_CACHED_ROWS):
+        self.max_rows = max_rows
+        self._rows = OrderedDict()
+        # Tables and rows checked by the last run, the other rows came from the cache
+        self.tables = 0
+        self.rows_checked = 0
+
+    def _row(self, html):
+        result = self._rows.get(html)
+        if result is not None:
+            self._rows.move_to_end(html)
+            return result
+        result = self._rows[html] = _check_row(html)
+        self.rows_checked += 1
+        if len(self._rows) > self.max_rows:
+            self._rows.popitem(last=False)
+        return result
+
+    def lint(self, html):
+        """Return the LintProblems of every table in the HTML, in text order."""
+        self.rows_checked = 0
+        problems = []
+        with timer("lint", logger):
+            spans = table_spans(html)
+            for index, (start, end) in enumerate(spans):
+                self._lint_table(html, start, end, index, problems)
+        self.tables = len(spans)
+        problems.sort(key=lambda problem: (problem.start, _RULE_ORDER[problem.code]))
+        return problems
+
+    def _lint_table(self, html, start, end, table, problems):
+        bounds = [start] + _row_starts(html, start, end) + [end]
+        rows = []
+        for position, (chunk_start, chunk_end) in enumerate(zip(bounds, bounds[1:])):
+            result = self._row(html[chunk_start:chunk_end])
+            row = position - 1 if position else None
+            for name, tag_start, tag_end in result.bad_tags:
+                problems.append(LintProblem('tags', f"<{name}> is not whitelisted, normalizing unwraps it",
+                                            chunk_start + tag_start, chunk_start + tag_end, table, row))
+            if result.credits is not None:
+                problems.append(LintProblem('credits', LINT_RULES['credits'], chunk_start + result.credits[0],
+                                            chunk_start + result.credits[1], table, row))
+            if position:
+                rows.append((chunk_start, result))
+        self._lint_grid(rows, table, problems)
+
+    @staticmethod
+    def _lint_grid(rows, table, problems):
+        """Lay the cells out with the HTML table rules, as grid.TableGrid does, and check the layout."""
+        height = len(rows)
+        # Columns covered by rowspans from earlier rows, for the rows they reach
+        covered = {}
+        # Columns each row fills, with the ones covered from above
+        counts = []
+        width = 0
+        # (col, colspan) of the cells of the first row, and (row, col, start, end) of every header cell
+        first = []
+        headers = []
+        for r, (offset, result) in enumerate(rows):
+            taken = covered.pop(r, None)
+            filled = set(taken) if taken else None
+            col = 0
+            for name, rowspan, colspan, cell_start, cell_end in result.cells:
+                if taken:
+                    while col in taken:
+                        col += 1
+                    columns = range(col, col + colspan)
+                    if not taken.isdisjoint(columns):
+                        problems.append(LintProblem('overlap', "Cell overlaps a cell spanning down from an earlier row",
+                                                    offset + cell_start, offset + cell_end, table, r))
+                    filled.update(columns)
+                if rowspan != 1:
+                    if rowspan == 0 or r + rowspan > height:
+                        rowspan = height - r
+                    for covered_row in range(r + 1, r + rowspan):
+                        covered.setdefault(covered_row, set()).update(range(col, col + colspan))
+                if not r:
+                    first.append((col, colspan))
+                if name == 'th':
+                    headers.append((r, col, offset + cell_start, offset + cell_end))
+                col += colspan
+            if taken:
+                counts.append(len(filled))
+                width = max(width, max(filled) + 1)
+            else:
+                # Nothing reaches down into the row, its cells fill the columns from the left
+                counts.append(col)
+                width = max(width, col)
+
+        for r, (offset, result) in enumerate(rows):
+            if counts[r] < width:
+                problems.append(LintProblem('cells', f"Row fills {counts[r]} of the table's {width} columns",
+                                            offset, offset + result.tag_end, table, r))
+
+        merged_title = len(first) == 1 and first[0][0] == 0 and 1 < first[0][1] == width
+        header_row = 1 if merged_title else 0
+        for r, col, cell_start, cell_end in headers:
+            if col != 0 and r > header_row:
+                problems.append(LintProblem('header', LINT_RULES['header'], cell_start, cell_end, table, r))
+
+
+def utf16_offsets(text, offsets):
+    """Convert character offsets of the text to UTF-16 code unit offsets, the positions Qt documents use."""
+    if text.isascii():
+        return list(offsets)
+    astral = [match.start() for match in _ASTRAL_RE.finditer(text)]
+    if not astral:
+        return list(offsets)
+    return [offset + bisect_left(astral, offset) for offset in offsets]
@@ -0,0 +1,162 @@
+import threading
+
+try:
+    from PyQt6.QtGui import QTextCharFormat, QTextCursor, QColor
+    from PyQt6.QtWidgets import QWidget, QVBoxLayout, QToolButton, QListWidget, QTextEdit
+except (ImportError, AttributeError):
+    from PyQt5.QtGui import QTextCharFormat, QTextCursor, QColor
+    from PyQt5.QtWidgets import QWidget, QVBoxLayout, QToolButton, QListWidget, QTextEdit
+
+from .lint import TableLinter, utf16_offsets
+from .log import get_logger
+from .preview import RenderScheduler
+from .profiling_panel import RIGHT_ARROW, DOWN_ARROW, TEXT_BESIDE_ICON
+
+logger = get_logger("lint_panel")
+
+try:
+    WAVE_UNDERLINE = QTextCharFormat.UnderlineStyle.WaveUnderline
+    KEEP_ANCHOR = QTextCursor.MoveMode.KeepAnchor
+except AttributeError:
+    WAVE_UNDERLINE = QTextCharFormat.WaveUnderline
+    KEEP_ANCHOR = QTextCursor.KeepAnchor
+
+# The tables are linted at most once per this many milliseconds while typing
+DEFAULT_LINT_INTERVAL_MS = 400
+
+# Problems marked and listed, the rest are only counted: thousands of markers would slow the editor down
+MAX_SHOWN_PROBLEMS = 300
+
+# Underline colour of the inline markers: broken layouts in red, what normalizing cleans up in orange
+MARKER_COLORS = {
+    'cells': '#e5484d',
+    'overlap': '#e5484d',
+    'header': '#f5a524',
+    'tags': '#f5a524',
+    'credits': '#f5a524',
+}
+
+
+def describe(problem, tables):
+    """Return the line of a problem in the problem list."""
+    if problem.row is None:
+        where = "Table start"
+    else:
+        where = f"Row {problem.row + 1}"
+    if tables > 1:
+        where = f"Table {problem.table + 1}, {where[0].lower()}{where[1:]}"
+    return f"{where}: {problem.message}"
+
+
+class LintPanel(QWidget):
+    """Problem list of the tables in the HTML editor, with markers in the editor itself.
+
+    The linter runs in a background thread, throttled like the preview: at most one run per interval and one run at
+    a time, and results of text that has changed since are dropped. Only the rows an edit touched are checked again.
+    """
+
+    def __init__(self, html_editor, main_window, interval_ms=DEFAULT_LINT_INTERVAL_MS, parent=None):
+        super().__init__(parent)
+        self.html_editor = html_editor
+        self.taskman = main_window.taskman
+        self.linter = TableLinter()
+        # A run that outlives the scheduler's in-flight timeout must not overlap the next one
+        self.lint_lock = threading.Lock()
+        self.problems = []
+        self.generation = 0
+
+        self.toggle_button = QToolButton()
+        self.toggle_button.setToolButtonStyle(TEXT_BESIDE_ICON)
+        self.toggle_button.setCheckable(True)
+        self.toggle_button.setAutoRaise(True)
+        self.toggle_button.toggled.connect(self.set_expanded)
+
+        self.problem_list = QListWidget()
+        self.problem_list.setMaximumHeight(110)
+        self.problem_list.itemClicked.connect(self.jump_to_problem)
+
+        layout = QVBoxLayout(self)
+        layout.setContentsMargins(0, 0, 0, 0)
+        layout.addWidget(self.toggle_button)
+        layout.addWidget(self.problem_list)
+        self.toggle_button.setChecked(True)
+        self.update_title()
+
+        self.scheduler = RenderScheduler(self.start_lint, interval_ms, self, name="Lint")
+        self.html_editor.textChanged.connect(self.on_text_changed)
+        self.scheduler.request()
+
+    def set_expanded(self, expanded):
+        self.toggle_button.setArrowType(DOWN_ARROW if expanded else RIGHT_ARROW)
+        self.problem_list.setVisible(expanded)
+
+    def update_title(self):
+        count = len(self.problems)
+        self.toggle_button.setText(f"Table Problems ({count})" if count else "Table Problems (none)")
+
+    def on_text_changed(self):
+        self.generation += 1
+        self.scheduler.request()
+
+    def start_lint(self):
+        text = self.html_editor.toPlainText()
+        generation = self.generation
+
+        def task():
+            with self.lint_lock:
+                problems = self.linter.lint(text)
+                tables, rows_checked = self.linter.tables, self.linter.rows_checked
+            logger.debug("Linted %d tables, %d rows checked, %d problems", tables, rows_checked, len(problems))
+            # Qt counts positions in UTF-16 code units
+            offsets = utf16_offsets(text, [offset for problem in problems for offset in (problem.start, problem.end)])
+            return problems, offsets, tables
+
+        self.taskman.run_in_background(task, lambda future: self.lint_finished(future, generation))
+
+    def lint_finished(self, future, generation):
+        self.scheduler.render_finished()
+        try:
+            problems, offsets, tables = future.result()
+        except Exception:
+            logger.exception("Linting the tables failed")
+            return
+        if generation != self.generation:
+            # The text changed while linting, the scheduler lints it again
+            return
+        self.show_problems(problems, offsets, tables)
+
+    def show_problems(self, problems, offsets, tables):
+        """Mark the problems in the editor and list them."""
+        document = self.html_editor.document()
+        last = max(0, document.characterCount() - 1)
+        selections = []
+        shown = problems[:MAX_SHOWN_PROBLEMS]
+        for index, problem in enumerate(shown):
+            marker = QTextEdit.ExtraSelection()
+            marker.format.setUnderlineStyle(WAVE_UNDERLINE)
+            marker.format.setUnderlineColor(QColor(MARKER_COLORS[problem.code]))
+            cursor = QTextCursor(document)
+            cursor.setPosition(min(offsets[2 * index], last))
+            cursor.setPosition(min(offsets[2 * index + 1], last), KEEP_ANCHOR)
+            marker.cursor = cursor
+            selections.append(marker)
+        # The markers' cursors follow later edits until the next run replaces them
+        self.html_editor.setExtraSelections(selections)
+
+        self.problems = problems
+        self.problem_list.clear()
+        self.problem_list.addItems([describe(problem, tables) for problem in shown])
+        if len(problems) > len(shown):
+            self.problem_list.addItem(f"... and {len(problems) - len(shown)} more")
+        self.update_title()
+
+    def jump_to_problem(self, item):
+        selections = self.html_editor.extraSelections()
+        row = self.problem_list.row(item)
+        if row >= len(selections):
+            return
+        cursor = self.html_editor.textCursor()
+        cursor.setPosition(selections[row].cursor.selectionStart())
+        self.html_editor.setTextCursor(cursor)
+        self.html_editor.ensureCursorVisible()
+        self.html_editor.setFocus()
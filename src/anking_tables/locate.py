@@ -0,0 +1,112 @@
+import re
+
+from .log import get_logger
+
+logger = get_logger("locate")
+
+# Separator placed between the tables of a field in the HTML editor
+TABLE_SEPARATOR = '\n\n<br><!--Table Separator-->\n\n'
+
+# Comments and script/style contents are skipped, so a "<table" inside them is not taken for a table. Quoted
+# attribute values may contain ">".
+_TOKEN_RE = re.compile(r'<!--.*?(?:-->|\Z)'
+                       r'|<(script|style)\b.*?(?:</\1\s*>|\Z)'
+                       r'|<(/?)table\b(?:[^>"\']|"[^"]*"|\'[^\']*\')*>?',
+                       re.IGNORECASE | re.DOTALL)
+
+_TABLE_START_RE = re.compile(r'<table\b', re.IGNORECASE)
+
+# Start of a tag, a "<" followed by text is not one
+_TAG_START_RE = re.compile(r'<[a-zA-Z/!]')
+
+
+def has_table(html):
+    """Return whether the HTML may contain a table, with one scan and without copying it."""
+    return _TABLE_START_RE.search(html) is not None
+
+
+def inside_tag(html, position):
+    """Return whether position is inside the attributes of a tag that starts before it, as in <img alt="<table>">.
+
+    The tokenizers only look at the tags they need, so a tag in a quoted value of another tag is taken for a real one
+    unless it is checked with this. A value holding a ">" before the tag is not recognized.
+    """
+    return _TAG_START_RE.search(html, html.rfind('>', 0, position) + 1, position) is not None
+
+
+def table_spans(html):
+    """Return the (start, end) character offsets of every top-level <table> element in the HTML.
+
+    Nested tables are part of the span of the table that contains them. A table that is never closed runs to the end
+    of the HTML.
+    """
+    spans = []
+    # Most fields have no table at all, they are rejected without running the tokenizer
+    if not has_table(html):
+        return spans
+    depth = 0
+    start = None
+    for match in _TOKEN_RE.finditer(html):
+        if match.group(2) is None:
+            # Comment, script or style
+            continue
+        if html[match.start() - 1] != '>' and inside_tag(html, match.start()):
+            # Text of an attribute value. Most table tags follow another tag, which rules that out at once.
+            continue
+        if match.group(2):
+            if depth:
+                depth -= 1
+                if not depth:
+                    spans.append((start, match.end()))
+        else:
+            if not depth:
+                start = match.start()
+            depth += 1
+    if depth:
+        spans.append((start, len(html)))
+    return spans
+
+
+def split_tables(html, spans=None):
+    """Return the HTML of every top-level table."""
+    if spans is None:
+        spans = table_spans(html)
+    return [html[start:end] for start, end in spans]
+
+
+def splice_tables(html, spans, replacements):
+    """Replace some of the tables at the given spans, leaving everything else byte-identical.
+
+    replacements maps the position of a table in spans to its new HTML.
+    """
+    parts = []
+    last = 0
+    for position in sorted(replacements):
+        start, end = spans[position]
+        parts.append(html[last:start])
+        parts.append(replacements[position])
+        last = end
+    parts.append(html[last:])
+    return ''.join(parts)
+
+
+def join_tables(tables):
+    """Return the tables of a field as shown in the HTML editor."""
+    return TABLE_SEPARATOR.join(tables)
+
+
+def splice_edited_tables(field_html, edited_html):
+    """Put the tables edited in the HTML editor back into the field.
+
+    The edited tables are located in the editor text the same way as in the field, so the separators between them
+    play no part. Only the tables that were changed are spliced into their spans, the other tables and the HTML around
+    them stay byte-identical. Raises ValueError when the editor no longer has as many tables as the field.
+    """
+    spans = table_spans(field_html)
+    edited_tables = split_tables(edited_html)
+    if len(edited_tables) != len(spans):
+        raise ValueError(f"The editor has {len(edited_tables)} tables but the field has {len(spans)}, "
+                         f"add or remove tables in the note editor instead")
+    replacements = {position: edited for position, (edited, (start, end)) in enumerate(zip(edited_tables, spans))
+                    if edited != field_html[start:end]}
+    return splice_tables(field_html, spans, replacements)
@@ -0,0 +1,80 @@
+import logging
+import time
+from contextlib import contextmanager
+from logging.handlers import RotatingFileHandler
+
+LOG_FORMAT = "%(asctime)s %(levelname)s %(name)s: %(message)s"
+MAX_LOG_BYTES = 1024 * 1024
+LOG_BACKUP_COUNT = 3
+
+logger = logging.getLogger("anking_tables")
+# Messages stay in the add-on's own log file instead of Anki's console
+logger.propagate = False
+logger.setLevel(logging.WARNING)
+
+
+def get_logger(name=None):
+    """Return the add-on logger, or a child of it for a module."""
+    return logger.getChild(name) if name else logger
+
+
+def setup_logging(log_path, level="WARNING"):
+    """Write add-on messages at or above level to a rotating log file."""
+    for handler in list(logger.handlers):
+        logger.removeHandler(handler)
+        handler.close()
+
+    handler = RotatingFileHandler(log_path, maxBytes=MAX_LOG_BYTES, backupCount=LOG_BACKUP_COUNT, encoding="utf-8",
+                                  delay=True)
+    handler.setFormatter(logging.Formatter(LOG_FORMAT))
+    logger.addHandler(handler)
+    set_level(level)
+
+
+def set_level(level):
+    """Set the log level from a level name like "DEBUG", falling back to WARNING for unknown names."""
+    if isinstance(level, str):
+        level = logging.getLevelName(level.upper())
+    if not isinstance(level, int):
+        level = logging.WARNING
+    logger.setLevel(level)
+
+
+# Functions called with (stage, seconds) after every timed stage, see add_stage_hook
+_stage_hooks = []
+
+
+def add_stage_hook(hook):
+    """Call hook(stage, seconds) after every stage timed with timer, from the thread that ran the stage."""
+    if hook not in _stage_hooks:
+        _stage_hooks.append(hook)
+
+
+def remove_stage_hook(hook):
+    if hook in _stage_hooks:
+        _stage_hooks.remove(hook)
+
+
+@contextmanager
+def timer(stage, log=logger):
+    """Log how long the body took at DEBUG level and pass it to the stage hooks.
+
+    Does nothing at all when DEBUG is off and no hook is registered.
+    """
+    debug = log.isEnabledFor(logging.DEBUG)
+    if not debug and not _stage_hooks:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_stage(stage, time.perf_counter() - start, log)
+
+
+def record_stage(stage, seconds, log=logger):
+    """Log and pass to the stage hooks a stage timed by the caller, for work that does not fit in a with block."""
+    if log.isEnabledFor(logging.DEBUG):
+        log.debug("%s took %.1f ms", stage, seconds * 1000)
+    for hook in list(_stage_hooks):
+        hook(stage, seconds)
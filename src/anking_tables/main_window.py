@@ -1,45 +1,98 @@
 import os
+import threading
 
 import aqt
+from anki.collection import OpChanges
+from aqt.operations import CollectionOp, QueryOp
+from aqt.utils import showWarning, tooltip
 # from aqt import mw
 from aqt.webview import AnkiWebView
-from bs4 import BeautifulSoup, NavigableString
-import re
 
 # PyQt5 and PyQt6 compatibility
 try:
-    from PyQt6.QtCore import QRegularExpression, QUrl, Qt, QT_VERSION_STR
+    from PyQt6.QtCore import QRegularExpression, QUrl, Qt, QT_VERSION_STR, QTimer, QStringListModel
     from PyQt6.QtGui import QSyntaxHighlighter, QTextCharFormat, QColor, QFont, QGuiApplication, QIcon, QKeySequence, \
-        QShortcut
+        QShortcut, QTextCursor
     from PyQt6.QtWebEngineWidgets import QWebEngineView
     from PyQt6.QtWidgets import QApplication, QWidget, QVBoxLayout, QHBoxLayout, QTextEdit, QPushButton, QMainWindow, \
-        QDockWidget, QFrame, QMessageBox, QLineEdit, QLabel, QSizePolicy, QSpacerItem
+        QDockWidget, QFrame, QMessageBox, QLineEdit, QLabel, QSizePolicy, QSpacerItem, QProgressDialog, QComboBox, \
+        QCompleter
 except (ImportError, AttributeError):
-    from PyQt5.QtCore import QRegularExpression, QUrl, Qt, QT_VERSION_STR
-    from PyQt5.QtGui import QSyntaxHighlighter, QTextCharFormat, QColor, QFont, QIcon, QKeySequence
+    from PyQt5.QtCore import QRegularExpression, QUrl, Qt, QT_VERSION_STR, QTimer, QStringListModel
+    from PyQt5.QtGui import QSyntaxHighlighter, QTextCharFormat, QColor, QFont, QIcon, QKeySequence, QTextCursor
     from PyQt5.QtWebEngineWidgets import QWebEngineView, QWebEnginePage
     from PyQt5.QtWidgets import QApplication, QWidget, QVBoxLayout, QHBoxLayout, QTextEdit, QPushButton, QMainWindow, \
-        QDockWidget, QDesktopWidget, QFrame, QMessageBox, QShortcut, QLineEdit, QLabel, QSizePolicy, QSpacerItem
-
-from .utils import process_table, deheader_first_column, headerize_first_column, parse_html, contains_credits, \
-    is_night_mode, search_text
+        QDockWidget, QDesktopWidget, QFrame, QMessageBox, QShortcut, QLineEdit, QLabel, QSizePolicy, QSpacerItem, \
+        QProgressDialog, QComboBox, QCompleter
+
+from .utils import is_night_mode, search_text, get_table_index, get_config, get_similar_table_finder, \
+    get_tag_registry
+from .normalize import normalize_field
+from .locate import split_tables, join_tables, splice_edited_tables
+from .canonical import cluster_key, table_fingerprint
+from .bulk_apply import apply_to_all
+from .similarity import table_signature, DEFAULT_THRESHOLD
+from .log import get_logger, timer
+from .parse_cache import view_html, get_parse_cache
+from .text import extract_html_text, contains_credits
+from .history import EditHistory
+from .profiling import get_profiler
+from .reflow import reflow_html, minify_html, compact_edited_tables
+from .profiling_panel import PerformancePanel
+from .lint_panel import LintPanel, DEFAULT_LINT_INTERVAL_MS
+from .tags import TABLE_TAG_PREFIX, table_tag
+from .highlight import tokenize_line, TAG_TOKEN, ATTRIBUTE_TOKEN, VALUE_TOKEN, COMMENT_TOKEN, ENTITY_TOKEN
+from .preview import RenderScheduler, DEFAULT_INTERVAL_MS, preview_page_body, patch_script, preview_css
+
+logger = get_logger("main_window")
+
+# Typing pauses longer than this are recorded as a version in the session history
+HISTORY_IDLE_MS = 1000
 
 
 class HtmlHighlighter(QSyntaxHighlighter):
+    """Colors tags by family plus attributes, values, comments and entities.
+
+    The tokenizer state at the end of each line is stored as the block state, so Qt only re-highlights the edited
+    lines and the lines after them whose starting state changed.
+    """
+    tagColors = {
+        'table': "#DE3163",
+        'cell': "#3A86FF",
+        'format': "#E09F3E",
+        'list': "#2A9D8F",
+        'media': "#9B5DE5",
+        'other': "#8D99AE",
+    }
+    tokenColors = {
+        ATTRIBUTE_TOKEN: "#F4845F",
+        VALUE_TOKEN: "#43AA8B",
+        COMMENT_TOKEN: "#7F8C8D",
+        ENTITY_TOKEN: "#C77DFF",
+    }
+
     def __init__(self, parent=None):
         super(HtmlHighlighter, self).__init__(parent)
-        keywordFormat = QTextCharFormat()
-        keywordFormat.setForeground(QColor("#DE3163"))
-        keywordPatterns = ["<[^>]*>"]
-        self.highlightingRules = [(QRegularExpression(pattern), keywordFormat) for pattern in keywordPatterns]
+        # Formats are built once, highlightBlock only looks them up
+        self.tagFormats = {family: self.make_format(color) for family, color in self.tagColors.items()}
+        self.tokenFormats = {token: self.make_format(color) for token, color in self.tokenColors.items()}
+        self.tokenFormats[COMMENT_TOKEN].setFontItalic(True)
+
+    @staticmethod
+    def make_format(color):
+        text_format = QTextCharFormat()
+        text_format.setForeground(QColor(color))
+        return text_format
 
     def highlightBlock(self, text):
-        for pattern, format in self.highlightingRules:
-            expression = QRegularExpression(pattern)
-            it = expression.globalMatch(text)
-            while it.hasNext():
-                match = it.next()
-                self.setFormat(match.capturedStart(), match.capturedLength(), format)
+        with timer("highlight", logger):
+            tokens, state = tokenize_line(text, self.previousBlockState())
+            for start, length, token, family in tokens:
+                if token == TAG_TOKEN:
+                    self.setFormat(start, length, self.tagFormats[family])
+                else:
+                    self.setFormat(start, length, self.tokenFormats[token])
+            self.setCurrentBlockState(state)
 
 
 class HtmlViewer(QWidget):
@@ -51,30 +104,30 @@ class HtmlViewer(QWidget):
     #     cls._instance = super(HtmlViewer, cls).__new__(cls, *args, **kwargs)
     #     return cls._instance
 
-    def __init__(self, field_html, card, main_window, col, editor, fieldName, note_id):
+    def __init__(self, field_html, card, main_window, col, editor, fieldName, note_id, cluster=None):
         super().__init__()
         self.initial_html = None
         self.webView = None
         self.highlighter = None
         self.htmlEditor = None
-        self.field_html, self.original_tables = self.filter_tables(field_html)
+        self.field_html = self.filter_tables(field_html)
         self.card = card
         self.fieldName = fieldName
         self.note_id = note_id
         self.mw = main_window
         self.col = col
+        # The editor of the note, None when the window was opened from the duplicate tables of the collection
         self.editor = editor
+        # Cluster key of the table that Apply to All replaces in every note, when opened for a cluster
+        self.cluster = cluster
+        # Whether the editor shows one row or cell per line, and whether it ever did this session
+        self.reflow = False
+        self.reflow_used = False
         self.initUI(note_id, fieldName)
 
     def filter_tables(self, html):
-        soup = BeautifulSoup(html, 'html.parser')
-        original_tables = soup.find_all('table')
-        table_strings = []
-        for i, table in enumerate(original_tables):
-            table_strings.append(str(table))
-            if i < len(original_tables) - 1:
-                table_strings.append('\n\n<br><!--Table Separator-->\n\n')
-        return ''.join(table_strings), original_tables
+        # The tables are shown exactly as stored so untouched tables are written back unchanged
+        return join_tables(split_tables(html))
 
     def initUI(self, note_id, field_name):
         main_layout = QVBoxLayout(self)
@@ -89,6 +142,9 @@ class HtmlViewer(QWidget):
         self.bottom_buttons = BottomButtons(self)
         main_layout.addLayout(self.bottom_buttons)
 
+        self.performance_panel = PerformancePanel(self)
+        main_layout.addWidget(self.performance_panel)
+
         self.update_tag_display()
 
         self.setLayout(main_layout)
@@ -97,42 +153,137 @@ class HtmlViewer(QWidget):
         self.setGeometry(*self.calculate_geometry())
         self.show()
 
-        self.central_widget.htmlEditor.textChanged.connect(self.update_html_viewer)
+        # Edits are rendered through the scheduler so bursts of typing cause a single preview update
+        self.render_scheduler = RenderScheduler(self.update_html_viewer,
+                                                get_config().get("preview_interval_ms", DEFAULT_INTERVAL_MS), self,
+                                                stage="render")
+        self.central_widget.htmlEditor.textChanged.connect(self.render_scheduler.request)
 
+        # The preview page is loaded once, later edits are patched into it by update_html_viewer
         self.initial_html = self.central_widget.htmlEditor.toPlainText()
-        self.set_html(self.initial_html)
+        self.set_html(self.initial_html, ["js/reviewer.js", "js/webview.js"])
+
+        # Session history: button transforms are recorded right away, typing once it pauses
+        self.history = EditHistory(self.initial_html)
+        self.restoring_version = False
+        self.history_timer = QTimer(self)
+        self.history_timer.setSingleShot(True)
+        self.history_timer.setInterval(HISTORY_IDLE_MS)
+        self.history_timer.timeout.connect(self.record_version)
+        self.central_widget.htmlEditor.textChanged.connect(self.on_text_changed)
+        self.top_toolbar.update_history(self.history)
+        if get_config().get("reflow_editor", False):
+            self.top_toolbar.reflow_button.setChecked(True)
+
+        # Tag suggestions come from the registry, which is read in the background the first time
+        self.tag_registry = None
+        QueryOp(parent=self, op=get_tag_registry, success=self.set_tag_registry).run_in_background()
+
+    def set_tag_registry(self, registry):
+        self.tag_registry = registry
+        self.bottom_buttons.set_tag_registry(registry)
 
     def set_html(self, html, js_files=None):
-        anking_note_type = self.col.models.by_name("AnKingOverhaul (AnKing / AnKingMed)")
-        if not anking_note_type:
-            print("AnKingOverhaul note type not found")
-            return
-
-        anking_css = anking_note_type['css']
-        corrected_css = """
-        .card {
-            padding: 0px;
-            margin: 0px;
-        }
-        .html, td, tr {
-            padding: 0px;
-            font-size: 22px;
-            text-align: center !important;
-        }
-        .table {
-            width: 100%;
-        }
-        """
-        anking_css += corrected_css
-        style_tag = f"<style>{anking_css}</style>"
-        html = style_tag + html
+        """Load the preview page with the note type CSS, the given scripts and the table."""
+        note = self.editor.note if self.editor is not None else self.col.get_note(self.note_id)
+        css = preview_css(self.col, note)
+        style_tag = f"<style>{css}</style>"
+        html = style_tag + preview_page_body(html)
 
         self.central_widget.webView.stdHtml(html, css=None, js=js_files, context=self)
 
     def update_html_viewer(self):
         html = self.central_widget.htmlEditor.toPlainText()
-        js_files = ["js/reviewer.js", "js/webview.js"]
-        self.set_html(html, js_files)
+        # Timed by the scheduler, from here until the preview reports back
+        self.central_widget.webView.evalWithCallback(patch_script(html), self.render_scheduler.render_finished)
+
+    def on_text_changed(self):
+        if not self.restoring_version:
+            self.history_timer.start()
+
+    def record_version(self, label="Edit"):
+        """Record the editor text as a new version of the session history. Returns whether a version was added."""
+        self.history_timer.stop()
+        if not self.history.record(self.central_widget.htmlEditor.toPlainText(), label):
+            return False
+        self.top_toolbar.update_history(self.history)
+        return True
+
+    def set_editor_text(self, html):
+        """Replace the editor text as a single step of the editor's undo stack."""
+        html_editor = self.central_widget.htmlEditor
+        cursor = html_editor.textCursor()
+        try:
+            # PyQt6
+            document = QTextCursor.SelectionType.Document
+        except AttributeError:
+            # PyQt5
+            document = QTextCursor.Document
+        self.restoring_version = True
+        try:
+            cursor.beginEditBlock()
+            cursor.select(document)
+            cursor.insertText(html)
+            cursor.endEditBlock()
+        finally:
+            self.restoring_version = False
+
+    def apply_transform(self, label, html):
+        """Put the result of a toolbar transform in the editor and record it in the session history."""
+        if self.reflow:
+            html = reflow_html(html)
+        # Edits typed since the last version are kept as their own version
+        self.record_version()
+        self.set_editor_text(html)
+        self.record_version(label)
+
+    def set_reflow(self, enabled):
+        """Switch the editor between one row or cell per line and the compact form the tables are stored in."""
+        if enabled == self.reflow:
+            return
+        self.reflow = enabled
+        self.reflow_used = self.reflow_used or enabled
+        text = self.central_widget.htmlEditor.toPlainText()
+        with timer("reflow", logger):
+            html = reflow_html(text) if enabled else minify_html(text)
+        self.apply_transform("Reflow" if enabled else "Compact", html)
+
+    def stored_html(self):
+        """Return the editor text as it is written to the note.
+
+        After reflowing, the tables are minified again, and tables whose only change is their layout keep their
+        original HTML, so the stored field does not grow.
+        """
+        text = self.central_widget.htmlEditor.toPlainText()
+        if not self.reflow_used:
+            return text
+        with timer("minify", logger):
+            return compact_edited_tables(text, self.initial_html)
+
+    def jump_to_version(self, index):
+        """Move to the version at index in the history list."""
+        history = self.history
+        # Recording the edits typed since the last version can drop or renumber versions, so the pick is resolved to
+        # its number in the session first
+        number = history.dropped + index + 1
+        branched = index > history.current
+        if self.record_version() and branched:
+            # The edits replaced the versions after the one they were typed on, the picked one among them
+            tooltip(f"Version {number} was replaced by your latest edits", parent=self)
+            return
+        version = number - history.dropped - 1
+        if version == history.current:
+            return
+        if not 0 <= version < len(history):
+            self.top_toolbar.update_history(history)
+            return
+        self.set_editor_text(history.goto(version))
+        self.top_toolbar.update_history(history)
+
+    def closeEvent(self, event):
+        logger.debug("Parse cache: %s, preview latency: %s", get_parse_cache().stats(),
+                     self.render_scheduler.latency_stats())
+        super().closeEvent(event)
 
     def calculate_geometry(self):
         try:
@@ -150,10 +301,41 @@ class HtmlViewer(QWidget):
 
         return int(left), int(top), int(window_width), int(window_height)
 
+    def search_similar_tables(self):
+        """Open the Browser on the notes with tables similar to the one being edited, most similar first."""
+        tables = [view_html(table_html).table for table_html in split_tables(self.initial_html)]
+        signatures = [table_signature(table) for table in tables]
+        fingerprints = [table_fingerprint(table) for table in tables]
+        threshold = get_config().get("similar_table_threshold", DEFAULT_THRESHOLD)
+        index = get_table_index()
+
+        def op(col):
+            with timer("index sync", logger):
+                index.sync(col)
+            # Exact copies are found by fingerprint, even tables too short for a useful signature
+            matches = {note_id: 1.0 for note_id, _ in index.lookup(fingerprints)}
+            finder = get_similar_table_finder()
+            for signature in signatures:
+                for similarity, note_id, _, _ in finder.find_similar(signature, threshold):
+                    matches[note_id] = max(similarity, matches.get(note_id, 0.0))
+            return sorted(matches.items(), key=lambda match: -match[1])
+
+        def on_success(matches):
+            if not matches:
+                # Nothing similar enough in the index, fall back to searching for the table's text
+                search_text(extract_html_text(self.initial_html))
+                return
+            logger.debug("Similar tables: %s", matches)
+            tooltip(f"Found {len(matches)} notes with a similar table (best match {matches[0][1]:.0%})",
+                    parent=self.mw)
+            search_text("nid:" + ",".join(str(note_id) for note_id, _ in matches))
+
+        QueryOp(parent=self, op=op, success=on_success).run_in_background()
+
     def update_tag_display(self):
         note = self.col.get_note(self.note_id)
         tags = note.tags
-        table_tags = [tag for tag in tags if tag.startswith('!AK_UpdateTags::Table::')]
+        table_tags = [tag for tag in tags if tag.startswith(TABLE_TAG_PREFIX)]
         specific_table_tag = [tag.split('::')[-1] for tag in table_tags]
         tag_text = ', '.join(specific_table_tag)
         self.bottom_buttons.tag_edit.setText(tag_text)
@@ -224,7 +406,7 @@ class TopToolbar(QHBoxLayout):
         for i, button in enumerate(buttons):
             button.setFixedSize(25, 25)
             if i == 0:
-                button.clicked.connect(lambda: self.parent.central_widget.htmlEditor.setPlainText(self.parent.initial_html))
+                button.clicked.connect(lambda: self.parent.apply_transform("Reset", self.parent.initial_html))
                 button.setIcon(QIcon(os.path.join(os.path.dirname(__file__), 'icons','reset_dark.png' if is_night_mode else 'reset_light.png')))
                 button.setToolTip("Reset to original table")
             elif i == 1:
@@ -258,6 +440,26 @@ class TopToolbar(QHBoxLayout):
                 self.addItem(spacer)
         self.addStretch(1)
 
+        self.reflow_button = QPushButton("Reflow")
+        self.reflow_button.setCheckable(True)
+        self.reflow_button.setToolTip("Show one row or cell per line while editing. The tables are stored in their "
+                                      "compact form.")
+        self.reflow_button.toggled.connect(self.parent.set_reflow)
+        self.addWidget(self.reflow_button)
+
+        self.history_combo = QComboBox()
+        self.history_combo.setToolTip("Go back to an earlier version of the table from this session")
+        self.history_combo.activated.connect(self.parent.jump_to_version)
+        self.addWidget(self.history_combo)
+
+    def update_history(self, history):
+        self.history_combo.blockSignals(True)
+        self.history_combo.clear()
+        for number, label in history.entries():
+            self.history_combo.addItem(f"{number}. {label}")
+        self.history_combo.setCurrentIndex(history.current)
+        self.history_combo.blockSignals(False)
+
 
 class BottomButtons(QVBoxLayout):
     def __init__(self, parent):
@@ -272,6 +474,17 @@ class BottomButtons(QVBoxLayout):
                                  "underscores.</font>")
         self.tag_edit.textChanged.connect(self.update_tag_width)
 
+        # The popup shows the registry's ranking as is, the completer must not filter it again
+        self.tag_registry = None
+        self.tag_model = QStringListModel()
+        self.tag_completer = QCompleter(self.tag_model, self.tag_edit)
+        try:
+            self.tag_completer.setCompletionMode(QCompleter.CompletionMode.UnfilteredPopupCompletion)
+        except AttributeError:
+            self.tag_completer.setCompletionMode(QCompleter.UnfilteredPopupCompletion)
+        self.tag_edit.setCompleter(self.tag_completer)
+        self.tag_edit.textEdited.connect(self.suggest_tags)
+
         self.addWidget(self.tag_label)  # Add the label to the vertical layout
 
         self.buttons_layout = QHBoxLayout()  # Create a horizontal layout for the buttons and the tag field
@@ -279,6 +492,18 @@ class BottomButtons(QVBoxLayout):
 
         self.add_buttons()
 
+    def set_tag_registry(self, registry):
+        self.tag_registry = registry
+        if self.tag_edit.hasFocus():
+            self.suggest_tags(self.tag_edit.text())
+
+    def suggest_tags(self, text):
+        if self.tag_registry is None:
+            return
+        self.tag_model.setStringList(self.tag_registry.complete(text))
+        if self.tag_model.rowCount():
+            self.tag_completer.complete()
+
     def update_tag_width(self, text):
         # Calculate the width of the text and set it as the minimum width of the QLineEdit
         font_metrics = self.tag_edit.fontMetrics()
@@ -291,19 +516,20 @@ class BottomButtons(QVBoxLayout):
         apply_button.clicked.connect(
             lambda: self.parent.central_widget.apply_changes(self.parent.editor, self.parent.mw.col,
                                                              self.parent.note_id, self.parent.fieldName,
-                                                             self.parent.central_widget.htmlEditor.toPlainText()))
+                                                             self.parent.stored_html()))
 
         apply_to_all_button = QPushButton("Apply to All")
         apply_to_all_button.setToolTip("Apply changes to all cards with this table")
-        apply_to_all_button.clicked.connect(lambda: self.parent.central_widget.apply_changes_to_all(self.parent.mw.col, self.parent.central_widget.htmlEditor.toPlainText()))
-        apply_to_all_button.setEnabled(False)
+        apply_to_all_button.clicked.connect(lambda: self.parent.central_widget.apply_changes_to_all(self.parent.mw.col, self.parent.stored_html()))
+        if self.parent.cluster is not None:
+            apply_to_all_button.setToolTip("Apply changes to every copy of this table in the collection")
 
         cancel_button = QPushButton("Cancel")
         cancel_button.clicked.connect(self.parent.close)
 
         search_button = QPushButton("Search for Table")
         search_button.setToolTip("Find additional cards with this table")
-        search_button.clicked.connect(lambda: search_text(extract_html_text(self.parent.initial_html)))
+        search_button.clicked.connect(self.parent.search_similar_tables)
 
         # Add the buttons to the horizontal layout
         self.buttons_layout.addStretch(1)
@@ -322,6 +548,9 @@ class CentralWidget(QFrame):
     def __init__(self, editor, parent, initial_html):
         super().__init__(parent)
         self.htmlEditor = HtmlEditor(self, initial_html)
+        # Structural problems of the tables, checked in the background while typing
+        self.lint_panel = LintPanel(self.htmlEditor, parent.mw,
+                                    get_config().get("lint_interval_ms", DEFAULT_LINT_INTERVAL_MS), self)
         self.webView = AnkiWebView(title="table_editor")
         self.webView.setContentsMargins(0, 0, 0, 0)
         self.editor = editor
@@ -331,6 +560,7 @@ class CentralWidget(QFrame):
         vbox = QVBoxLayout()
         vbox.setContentsMargins(0, 0, 0, 0)
         vbox.addWidget(self.htmlEditor)
+        vbox.addWidget(self.lint_panel)
         vbox.addWidget(self.webView)
 
         central_layout.addLayout(vbox, 40)
@@ -340,11 +570,21 @@ class CentralWidget(QFrame):
     def apply_changes(self, editor, col, note_id, field_name, updated_html):
         note = col.get_note(note_id)
 
+        # The edited tables are spliced back into the field, the rest of the field is left untouched
+        with timer("splice", logger):
+            try:
+                field_html = splice_edited_tables(note[field_name], updated_html)
+            except ValueError as error:
+                showWarning(str(error), parent=self.parent)
+                return
+
+        old_tags = list(note.tags)
+
         # Remove the old table tags
-        current_tags = [tag for tag in note.tags if tag.startswith('!AK_UpdateTags::Table::')]
+        current_tags = [tag for tag in note.tags if tag.startswith(TABLE_TAG_PREFIX)]
 
         # Get the updated tag
-        updated_tag = "!AK_UpdateTags::Table::" + self.parent.bottom_buttons.tag_edit.text().replace(' ', '_')
+        updated_tag = table_tag(self.parent.bottom_buttons.tag_edit.text())
 
         # Check if old_tags is empty or updated_tag is not in old_tags
         if not current_tags or updated_tag not in current_tags:
@@ -354,18 +594,18 @@ class CentralWidget(QFrame):
             # Add the updated tag to the note
             note.add_tag(updated_tag)
 
-        # Replace the first table in the field with the updated table
-        soup = BeautifulSoup(note[field_name], "html.parser")
-        tables = soup.find_all("table")
-        tables[0].replace_with(BeautifulSoup(updated_html, "html.parser"))
+        with get_profiler().operation("Apply"):
+            note[field_name] = field_html
 
-        note[field_name] = str(soup)
-
-        # Save the updated note
-        col.update_note(note)
+            # Save the updated note
+            with timer("save", logger):
+                col.update_note(note)
+            if self.parent.tag_registry is not None:
+                self.parent.tag_registry.update_note(old_tags, note.tags)
 
-        # Refresh the editor
-        self.editor.set_note(note)
+            # Refresh the editor
+            if self.editor is not None:
+                self.editor.set_note(note)
 
         # Check if the note contains photo credit & warn user if it does
         if contains_credits(updated_html):
@@ -388,119 +628,77 @@ class CentralWidget(QFrame):
         self.parent.close()
 
     def apply_changes_to_all(self, col, updated_html):
-        print("Starting to apply changes to all notes...")
-
-        # Parse the initial HTML and find all tables in it
-        original_tables = BeautifulSoup(self.parent.initial_html, "html.parser").find_all("table")
-
-        # Remove <tbody> tags from original tables
-        original_tables_html = [str(table).replace("<tbody>", "").replace("</tbody>", "") for table in original_tables]
-
-        # Find all note IDs that contain the original tables
-        matched_note_ids = []
-        for original_table in original_tables_html:
-            print(f"Searching for notes containing the table: {str(original_table)}")
-            matched_note_ids.extend(col.find_notes(str(original_table)))
-        print(f"Found {len(matched_note_ids)} notes that contain the original tables.")
-
-        # Remove duplicates from the list
-        matched_note_ids = list(set(matched_note_ids))
-        print(f"Note IDs: {matched_note_ids}")
-
-        # # Iterate over all note IDs for print statements
-        # for note_id in matched_note_ids:
-        #     # Get the note associated with the current ID
-        #     note = col.get_note(note_id)
-        #
-        #     # Print the field contents of the note
-        #     for field_idx, field_content in enumerate(note.fields):
-        #         print(f"Note ID: {note_id}, Matched Table(s): {str(original_tables)}")
-
-        # Keep track of updated notes
-        updated_notes = []
-
-        # Iterate over all notes
-        for note_id in matched_note_ids:
-            note = col.get_note(note_id)
-            note_updated = False
-
-            # Check all fields for the original tables
-            for field_idx, field_content in enumerate(note.fields):
-                soup = BeautifulSoup(field_content, "html.parser")
-                tables = soup.find_all("table")
-
-                # Remove <tbody> tags from current tables and replace each table that matches any of the original tables
-                for table in tables:
-                    table_html = str(table).replace("<tbody>", "").replace("</tbody>", "")
-                    print(f"Searching for {table_html}")
-                    if table_html in original_tables_html:
-                        print(f"Found a matching table in note {note_id}, field {field_idx}")
-                        print(f"Table of matching note: {table_html}")
-                        print(f"Replacing the table with: {str(updated_html)}")
-                        table.replace_with(BeautifulSoup(updated_html, "html.parser"))
-                        note_updated = True
-                    else:
-                        print(f"Found no matching table in note {note_id}, field {field_idx}")
-                        print(f"Table of unmatched note: {table_html}")
-
-                # Convert the updated BeautifulSoup object back to a string and assign it back to the field
-                if note_updated:
-                    note.fields[field_idx] = str(soup)
-                    print(f"Updated field content: {note.fields[field_idx]}")
-
-            # Save the updated note
-            if note_updated:
-                col.update_note(note)
-                updated_notes.append(note_id)
-
-        print(f"Updated {len(updated_notes)} notes.")
-
-        # Create a filtered browser view with only the updated notes
-        browser = aqt.dialogs.open("Browser", self.editor.mw)
-        browser.form.searchEdit.lineEdit().setText("nid:" + ",".join(map(str, updated_notes)))
-        browser.onSearchActivated()
-        print("Filtered browser view created with the updated notes.")
-
-        self.parent.close()
+        # Copies of the tables are found by cluster key, so differently formatted copies are replaced too. Each table
+        # of the field replaces the copies of its original.
+        original_tables = split_tables(self.parent.initial_html)
+        edited_tables = split_tables(updated_html)
+        if len(edited_tables) != len(original_tables):
+            showWarning(f"The editor has {len(edited_tables)} tables but the note has {len(original_tables)}, "
+                        f"add or remove tables in the note editor instead", parent=self.parent)
+            return
+        replacements = {}
+        for original, edited in zip(original_tables, edited_tables):
+            key = cluster_key(view_html(original).table)
+            # Opened for a cluster, only the cluster's table replaces its copies, not every table of the field
+            if self.parent.cluster is None or key == self.parent.cluster:
+                replacements[key] = edited
+        index = get_table_index()
+
+        # Progress dialog with a cancel button, updated from the background operation
+        progress_dialog = QProgressDialog("Applying table to all notes...", "Cancel", 0, 0, self.parent)
+        progress_dialog.setWindowTitle("Apply to All")
+        progress_dialog.setMinimumDuration(0)
+        cancel_requested = threading.Event()
+        progress_dialog.canceled.connect(cancel_requested.set)
+        progress_dialog.show()
+
+        def update_progress(done, total):
+            def update():
+                progress_dialog.setMaximum(total)
+                progress_dialog.setValue(done)
+                progress_dialog.setLabelText(f"Applying table to all notes... {done}/{total}")
+            self.parent.mw.taskman.run_on_main(update)
+
+        def op(col):
+            with get_profiler().operation("Apply to All"):
+                result = apply_to_all(col, index, replacements, progress=update_progress,
+                                      want_cancel=cancel_requested.is_set)
+            if result.changes is None:
+                result.changes = OpChanges()
+            return result
+
+        def on_success(result):
+            progress_dialog.close()
+            logger.info("Apply to All: %s", result.summary())
+            tooltip(result.summary(), parent=self.parent.mw)
+            if result.updated_note_ids:
+                # Create a filtered browser view with only the updated notes
+                browser = aqt.dialogs.open("Browser", self.parent.mw)
+                browser.form.searchEdit.lineEdit().setText("nid:" + ",".join(map(str, result.updated_note_ids)))
+                browser.onSearchActivated()
+            self.parent.close()
+
+        def on_failure(error):
+            progress_dialog.close()
+            logger.error("Apply to All failed: %s", error)
+            showWarning(f"Apply to All failed: {error}", parent=self.parent)
+
+        CollectionOp(parent=self.parent, op=op).success(on_success).failure(on_failure).run_in_background()
 
 
 def button1_func(parent):
-    html = parent.central_widget.htmlEditor.toPlainText()
-    soup = BeautifulSoup(html, 'html.parser')
-    for table in soup.find_all('table'):
-        process_table(table)
-        deheader_first_column(parent.editor, soup)
-    new_html = str(soup)
-    parent.central_widget.htmlEditor.setPlainText(new_html)
-    parent.set_html(new_html)
+    with get_profiler().operation("Header row"):
+        html = parent.central_widget.htmlEditor.toPlainText()
+        # Each table is normalized on its own, the separators and any text between the tables stay as they are
+        with timer("normalize", logger):
+            html, _, _ = normalize_field(html, header_column=False)
+        parent.apply_transform("Header row", html)
 
 
 def button2_func(parent):
-    html = parent.central_widget.htmlEditor.toPlainText()
-    soup = BeautifulSoup(html, 'html.parser')
-    for table in soup.find_all('table'):
-        process_table(table)
-        headerize_first_column(parent.editor, soup)
-    new_html = str(soup)
-    parent.central_widget.htmlEditor.setPlainText(new_html)
-    parent.set_html(new_html)
-
-
-def extract_html_text(initial_html):
-    soup = BeautifulSoup(initial_html, 'html.parser')
-
-    # Normalize whitespace within tags
-    for tag in soup.find_all(text=True):
-        tag.replace_with(tag.strip())
-
-    # Insert spaces between tags and text
-    for tag in soup.find_all():
-        if tag.next_sibling and isinstance(tag.next_sibling, NavigableString):
-            tag.next_sibling.replace_with(' ' + tag.next_sibling)
-
-    text = soup.get_text(separator=' ')
-    extracted_text = re.sub(r'\s+', ' ', text).strip()
-
-    # Calculate the midpoint and return the first half
-    midpoint = len(extracted_text) // 2
-    return extracted_text[:midpoint]
+    with get_profiler().operation("Header row & column"):
+        html = parent.central_widget.htmlEditor.toPlainText()
+        # Each table is normalized on its own, the separators and any text between the tables stay as they are
+        with timer("normalize", logger):
+            html, _, _ = normalize_field(html, header_column=True)
+        parent.apply_transform("Header row & column", html)
@@ -0,0 +1,248 @@
+from bs4 import BeautifulSoup, Tag
+
+from .grid import TableGrid
+from .locate import table_spans, splice_tables
+
+# Tags that are allowed to stay inside a table, every other tag is unwrapped
+TAG_WHITELIST = frozenset(['table', 'tbody', 'tr', 'td', 'th', 'br', 'b', 'u', 'i', 'ul', 'li', 'ol', 'img', 'sub',
+                           'sup', 'a'])
+
+# Attributes that survive the attribute strip, in the order they are restored
+PRESERVED_ATTRIBUTES = {
+    'img': ('colspan', 'rowspan', 'src', 'height', 'width'),
+}
+DEFAULT_PRESERVED_ATTRIBUTES = ('colspan', 'rowspan')
+
+CELL_TAGS = frozenset(['td', 'th'])
+
+# Row groups whose rows belong to the table that contains them
+SECTION_TAGS = frozenset(['tbody', 'thead', 'tfoot'])
+
+# Formatting tags that are removed from header cells
+FORMATTING_TAGS = frozenset(['b', 'u', 'i'])
+
+
+class TableScan:
+    """Rows, cells and formatting tags of a table, collected in a single tree walk."""
+
+    __slots__ = ('rows', 'row_cells', 'cell_formats', 'cell_children', 'grid')
+
+    def __init__(self):
+        # The table's own <tr> in document order (not the rows of nested tables)
+        self.rows = []
+        # The <td>/<th> children of each own row
+        self.row_cells = []
+        # id(cell) -> formatting tags whose innermost cell is this cell
+        self.cell_formats = {}
+        # id(cell) -> cells directly nested in this cell
+        self.cell_children = {}
+        # TableGrid of the own rows and cells, with the spans resolved
+        self.grid = None
+
+    def unwrap_formatting(self, cell):
+        """Unwrap every <b>, <u> and <i> inside a cell, including nested cells."""
+        pending = [cell]
+        while pending:
+            current = pending.pop()
+            key = id(current)
+            for tag in self.cell_formats.pop(key, ()):
+                tag.unwrap()
+            pending.extend(self.cell_children.get(key, ()))
+
+
+def scan_table(table, strip=True):
+    """Walk the table once, collecting rows and cells, and build its grid.
+
+    With strip=True the walk also removes every non-preserved attribute and unwraps every tag that is not in the
+    whitelist, which is the cleanup half of process_table. Cells of nested tables are content of the cell that contains
+    them, they are not part of the grid.
+    """
+    scan = TableScan()
+    own_rows = set()
+    open_cells = []
+
+    node = table
+    contents = table.contents
+    i = 0
+    stack = []
+    while True:
+        if i >= len(contents):
+            # Leaving node, close it if it was a cell
+            if not stack:
+                break
+            if node.name in CELL_TAGS:
+                open_cells.pop()
+            node, contents, i = stack.pop()
+            continue
+
+        child = contents[i]
+        if not isinstance(child, Tag):
+            i += 1
+            continue
+
+        name = child.name
+        if strip:
+            if name not in TAG_WHITELIST:
+                # The children take the tag's place, so visit the same index again
+                child.unwrap()
+                continue
+            attrs = child.attrs
+            if attrs:
+                preserved = PRESERVED_ATTRIBUTES.get(name, DEFAULT_PRESERVED_ATTRIBUTES)
+                child.attrs = {key: attrs[key] for key in preserved if attrs.get(key)}
+
+        if name == 'tr':
+            if node is table or (node.name in SECTION_TAGS and node.parent is table):
+                own_rows.add(id(child))
+                scan.rows.append(child)
+                scan.row_cells.append([])
+        elif name in CELL_TAGS:
+            if id(node) in own_rows:
+                scan.row_cells[-1].append(child)
+            if open_cells:
+                scan.cell_children.setdefault(id(open_cells[-1]), []).append(child)
+            open_cells.append(child)
+        elif name in FORMATTING_TAGS and open_cells:
+            scan.cell_formats.setdefault(id(open_cells[-1]), []).append(child)
+
+        stack.append((node, contents, i + 1))
+        node = child
+        contents = child.contents
+        i = 0
+
+    scan.grid = TableGrid(scan.rows, scan.row_cells)
+    return scan
+
+
+def normalize_table(table, header_column=None):
+    """Apply the Anking table format to a table in a single tree walk.
+
+    Strips attributes, unwraps non-whitelisted tags, demotes merged rows and promotes the header row. With
+    header_column=False the first column is then turned into regular cells (deheader_first_column), with
+    header_column=True it is turned into header cells (headerize_first_column).
+
+    Returns the number of header rows and the scan of the table.
+    """
+    table.attrs = {}
+    table['class'] = ['one']
+    table['border'] = '1'
+
+    scan = scan_table(table)
+    grid = scan.grid
+
+    # Convert rows that span across the whole table to td
+    for row in range(grid.height):
+        if grid.is_merged_row(row):
+            grid.first_cell(row).element.name = 'td'
+
+    # Convert the first row of cells into header cells
+    skip_rows = 1
+    if grid.height:
+        if grid.is_merged_row(0):
+            # Treat the second row as the header row
+            if grid.height > 1:
+                for cell in grid.row_cells(1):
+                    if cell.element.name == 'td':
+                        cell.element.name = 'th'
+                        scan.unwrap_formatting(cell.element)
+            skip_rows = 2
+        else:
+            for cell in grid.row_cells(0):
+                cell.element.name = 'th'
+                scan.unwrap_formatting(cell.element)
+
+    if header_column is False:
+        deheader_rows(scan, skip_rows)
+    elif header_column is True:
+        headerize_rows(scan)
+
+    return skip_rows, scan
+
+
+def deheader_rows(scan, skip_rows):
+    """Turn the first-column cell of every row after the header rows into a regular cell."""
+    grid = scan.grid
+    for row in range(skip_rows, grid.height):
+        # A cell spanning down from a header row stays a header cell
+        if grid.starts_in_column(row, 0):
+            grid.cell_at(row, 0).element.name = 'td'
+
+
+def headerize_rows(scan):
+    """Turn the first-column cell of every row into a header cell, skipping merged rows and rowspans."""
+    grid = scan.grid
+    for row in range(grid.height):
+        # If the first column is covered by a rowspan from an earlier row, it was handled with that row
+        if not grid.starts_in_column(row, 0):
+            continue
+        cell = grid.cell_at(row, 0).element
+        if cell.name != 'td' or grid.is_merged_row(row):
+            continue
+        if not any(other.element.name == 'th' for other in grid.row_cells(row)):
+            cell.name = 'th'
+            scan.unwrap_formatting(cell)
+
+
+def process_table(table):
+    """Process a table element to remove all styling and set the class to 'one' and border to '1'."""
+    skip_rows, _ = normalize_table(table)
+    return skip_rows
+
+
+def deheader_first_column(editor, soup):
+    deheader_soup(soup)
+
+
+def headerize_first_column(editor, soup):
+    headerize_soup(soup)
+
+
+def deheader_soup(soup):
+    """Normalize every table in the soup with a header row only."""
+    for table in soup.find_all('table'):
+        normalize_table(table, header_column=False)
+
+
+def headerize_soup(soup):
+    """Turn the first column of every table in the soup into header cells."""
+    for table in soup.find_all('table'):
+        headerize_rows(scan_table(table, strip=False))
+
+
+def normalize_soup(soup, header_column):
+    """Apply the header row (header_column=False) or header row & column (True) format to every table in the soup.
+
+    This is what the toolbar buttons do. Returns the number of tables.
+    """
+    tables = soup.find_all('table')
+    if len(tables) == 1:
+        # A single table is normalized and (de)headerized in one pass
+        normalize_table(tables[0], header_column=header_column)
+    else:
+        for table in tables:
+            normalize_table(table)
+            if header_column:
+                headerize_soup(soup)
+            else:
+                deheader_soup(soup)
+    return len(tables)
+
+
+def normalize_field(field_html, header_column):
+    """Apply the table format to every table in a field.
+
+    Returns the new field HTML, the number of tables and the number of tables whose HTML changed.
+    """
+    spans = table_spans(field_html)
+    replacements = {}
+    for position, (start, end) in enumerate(spans):
+        # Each table is parsed on its own, the HTML around the tables is never parsed or rewritten
+        soup = BeautifulSoup(field_html[start:end], 'html.parser')
+        before = str(soup)
+        normalize_soup(soup, header_column)
+        after = str(soup)
+        if after != before:
+            replacements[position] = after
+    if not replacements:
+        return field_html, len(spans), 0
+    return splice_tables(field_html, spans, replacements), len(spans), len(replacements)
@@ -0,0 +1,214 @@
+import json
+import time
+from collections import deque
+
+try:
+    from PyQt6.QtCore import QObject, QTimer
+except (ImportError, AttributeError):
+    from PyQt5.QtCore import QObject, QTimer
+
+from .log import get_logger, record_stage
+
+logger = get_logger("preview")
+
+DEFAULT_INTERVAL_MS = 150
+
+# A render that has not reported back after this long no longer blocks the next one
+MAX_IN_FLIGHT_SECONDS = 2.0
+
+# Number of keystroke-to-paint latencies kept for the statistics
+LATENCY_SAMPLES = 200
+
+PREVIEW_CONTAINER_ID = "anking-tables-preview"
+
+ANKING_NOTE_TYPE_NAME = "AnKingOverhaul (AnKing / AnKingMed)"
+
+# Appended to the note type CSS so the table fills the preview
+CORRECTED_CSS = """
+.card {
+    padding: 0px;
+    margin: 0px;
+}
+.html, td, tr {
+    padding: 0px;
+    font-size: 22px;
+    text-align: center !important;
+}
+.table {
+    width: 100%;
+}
+"""
+
+# note type id -> (note type mtime, composed CSS)
+_css_cache = {}
+
+# Loaded once with the preview page. ankingTablesPatch() updates the preview in place: when only rows changed it
+# replaces just those rows, otherwise it swaps the container's contents. The stylesheet and scripts are not reloaded
+# and the scroll position is kept.
+PATCH_SCRIPT = """
+function ankingTablesSkeleton(node) {
+    const clone = node.cloneNode(true);
+    for (const table of clone.querySelectorAll("table")) {
+        for (const row of Array.from(table.rows)) {
+            row.remove();
+        }
+    }
+    return clone.innerHTML;
+}
+
+function ankingTablesPatch(html) {
+    const container = document.getElementById("%(container)s");
+    const template = document.createElement("template");
+    template.innerHTML = html;
+    const oldTables = container.querySelectorAll("table");
+    const newTables = template.content.querySelectorAll("table");
+
+    let rowsOnly = oldTables.length === newTables.length && oldTables.length > 0;
+    for (let i = 0; rowsOnly && i < oldTables.length; i++) {
+        rowsOnly = oldTables[i].rows.length === newTables[i].rows.length;
+    }
+    if (rowsOnly) {
+        const wrapper = document.createElement("div");
+        wrapper.appendChild(template.content.cloneNode(true));
+        rowsOnly = ankingTablesSkeleton(container) === ankingTablesSkeleton(wrapper);
+    }
+    if (!rowsOnly) {
+        container.replaceChildren(template.content);
+        return;
+    }
+    for (let i = 0; i < oldTables.length; i++) {
+        if (!container.contains(oldTables[i])) {
+            // Nested table inside a row that was already replaced
+            continue;
+        }
+        const oldRows = Array.from(oldTables[i].rows);
+        const newRows = Array.from(newTables[i].rows);
+        for (let j = 0; j < oldRows.length; j++) {
+            if (oldRows[j].outerHTML !== newRows[j].outerHTML) {
+                oldRows[j].replaceWith(newRows[j]);
+            }
+        }
+    }
+}
+""" % {"container": PREVIEW_CONTAINER_ID}
+
+
+def preview_css(col, note=None):
+    """Return the preview stylesheet for a note: its note type's CSS followed by CORRECTED_CSS.
+
+    The composed stylesheet is cached per note type and rebuilt when the note type's mtime changes. Without a note the
+    AnKing note type is used, and when no note type is available only CORRECTED_CSS is returned.
+    """
+    notetype = note.note_type() if note is not None else None
+    if not notetype:
+        notetype = col.models.by_name(ANKING_NOTE_TYPE_NAME)
+    if not notetype:
+        logger.warning("No note type found for the preview, using the table CSS only")
+        return CORRECTED_CSS
+
+    cached = _css_cache.get(notetype['id'])
+    if cached is not None and cached[0] == notetype['mod']:
+        return cached[1]
+    css = notetype['css'] + CORRECTED_CSS
+    _css_cache[notetype['id']] = (notetype['mod'], css)
+    return css
+
+
+def preview_page_body(html):
+    """Return the body of the preview page, with the table inside the patchable container."""
+    return f'<div id="{PREVIEW_CONTAINER_ID}">{html}</div><script>{PATCH_SCRIPT}</script>'
+
+
+def patch_script(html):
+    """Return the JavaScript that replaces the preview contents with html."""
+    return f"window.ankingTablesPatch && ankingTablesPatch({json.dumps(html)});"
+
+
+class RenderScheduler(QObject):
+    """Coalesces bursts of edits into preview renders.
+
+    request() is called on every edit. The render callback runs at most once per interval with the latest text, and
+    only one render is in flight at a time: edits made while the preview is loading are folded into a single render
+    once the load finishes, so superseded intermediate states are never rendered.
+
+    Renders are usually asynchronous, so when stage is given the time from starting a render until render_finished()
+    is recorded as that stage.
+    """
+
+    def __init__(self, render, interval_ms=DEFAULT_INTERVAL_MS, parent=None, name="Preview", stage=None):
+        super().__init__(parent)
+        self._render = render
+        # Used in the log, the scheduler also throttles work other than preview renders
+        self.name = name
+        self.stage = stage
+        self.interval_ms = interval_ms
+        self._timer = QTimer(self)
+        self._timer.setSingleShot(True)
+        self._timer.timeout.connect(self._fire)
+        self._last_render = 0.0
+        # Time of the oldest edit that is not on screen yet
+        self._pending_since = None
+        self._generation = 0
+        self._rendered_generation = 0
+        # (generation, time of the oldest edit it contains, time the render started) of the render being loaded
+        self._in_flight = None
+        self.latencies = deque(maxlen=LATENCY_SAMPLES)
+
+    def request(self):
+        """Schedule a render for the latest edit."""
+        self._generation += 1
+        if self._pending_since is None:
+            self._pending_since = time.perf_counter()
+        if self._timer.isActive():
+            # Coalesced into the render that is already scheduled
+            return
+        elapsed_ms = (time.perf_counter() - self._last_render) * 1000
+        self._timer.start(int(max(0, self.interval_ms - elapsed_ms)))
+
+    def flush(self):
+        """Render the latest edit right away."""
+        self._timer.stop()
+        self._in_flight = None
+        self._generation += 1
+        if self._pending_since is None:
+            self._pending_since = time.perf_counter()
+        self._fire()
+
+    def _fire(self):
+        if self._generation == self._rendered_generation:
+            return
+        now = time.perf_counter()
+        if self._in_flight is not None and now - self._in_flight[2] < MAX_IN_FLIGHT_SECONDS:
+            # The previous render is still loading, render_finished() picks up the latest edit
+            return
+        self._in_flight = (self._generation, self._pending_since, now)
+        self._rendered_generation = self._generation
+        self._pending_since = None
+        self._last_render = now
+        self._render()
+
+    def render_finished(self, *args):
+        """Called when the preview has painted the last render."""
+        if self._in_flight is None:
+            return
+        _, edited_at, started_at = self._in_flight
+        self._in_flight = None
+        if self.stage is not None:
+            record_stage(self.stage, time.perf_counter() - started_at, logger)
+        if edited_at is not None:
+            self.latencies.append((time.perf_counter() - edited_at) * 1000)
+            logger.debug("%s finished %.1f ms after the edit (median %.1f ms, p95 %.1f ms over %d runs)",
+                         self.name, self.latencies[-1], *self.latency_stats())
+        if self._generation != self._rendered_generation and not self._timer.isActive():
+            # Edits arrived while loading, render them after the usual interval
+            elapsed_ms = (time.perf_counter() - self._last_render) * 1000
+            self._timer.start(int(max(0, self.interval_ms - elapsed_ms)))
+
+    def latency_stats(self):
+        """Return (median, p95, count) of the recorded keystroke-to-paint latencies in milliseconds."""
+        if not self.latencies:
+            return 0.0, 0.0, 0
+        ordered = sorted(self.latencies)
+        median = ordered[len(ordered) // 2]
+        p95 = ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))]
+        return median, p95, len(ordered)
@@ -0,0 +1,206 @@
+import io
+import json
+import platform
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+from .log import add_stage_hook, remove_stage_hook, get_logger
+
+logger = get_logger("profiling")
+
+# Kinds of capture that can be armed for the next operation
+CAPTURE_KINDS = ('cprofile', 'tracemalloc')
+
+# Functions listed in a cProfile capture, and allocation sites in a tracemalloc capture
+CAPTURE_LINES = 25
+
+
+class StageStats:
+    """Call count and durations (in seconds) of one pipeline stage."""
+
+    __slots__ = ('calls', 'total', 'min', 'max', 'last')
+
+    def __init__(self):
+        self.calls = 0
+        self.total = 0.0
+        self.min = None
+        self.max = 0.0
+        self.last = 0.0
+
+    def add(self, seconds):
+        self.calls += 1
+        self.total += seconds
+        self.min = seconds if self.min is None else min(self.min, seconds)
+        self.max = max(self.max, seconds)
+        self.last = seconds
+
+    def to_dict(self):
+        return {
+            'calls': self.calls,
+            'total_ms': round(self.total * 1000, 3),
+            'mean_ms': round(self.total * 1000 / self.calls, 3) if self.calls else 0.0,
+            'min_ms': round((self.min or 0.0) * 1000, 3),
+            'max_ms': round(self.max * 1000, 3),
+            'last_ms': round(self.last * 1000, 3),
+        }
+
+
+class Profiler:
+    """Collects the durations of the stages timed with log.timer and optional captures of single operations.
+
+    Stages are only collected between enable() and disable(), otherwise log.timer stays free. They are recorded from
+    any thread. A capture is armed with capture_next and runs during the next operation, the outermost block entered
+    with operation().
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.stages = {}
+        self.captures = []
+        self.started = time.time()
+        self._armed = None
+        self._running = threading.local()
+        # Number of enable() calls without a matching disable()
+        self._users = 0
+
+    def enable(self):
+        """Start collecting stages. Calls nest, every open performance panel enables the profiler once."""
+        with self._lock:
+            self._users += 1
+            if self._users == 1:
+                add_stage_hook(self.record)
+
+    def disable(self):
+        """Stop collecting stages once every enable() has been matched."""
+        with self._lock:
+            if not self._users:
+                return
+            self._users -= 1
+            if not self._users:
+                remove_stage_hook(self.record)
+
+    @property
+    def enabled(self):
+        return self._users > 0
+
+    def record(self, stage, seconds):
+        with self._lock:
+            stats = self.stages.get(stage)
+            if stats is None:
+                stats = self.stages[stage] = StageStats()
+            stats.add(seconds)
+
+    def reset(self):
+        with self._lock:
+            self.stages = {}
+            self.captures = []
+            self.started = time.time()
+
+    def capture_next(self, kind):
+        """Arm a cProfile or tracemalloc capture of the next operation, or disarm it with None."""
+        if kind is not None and kind not in CAPTURE_KINDS:
+            raise ValueError(f"Unknown capture kind {kind!r}, expected one of {CAPTURE_KINDS}")
+        self._armed = kind
+
+    @property
+    def armed(self):
+        return self._armed
+
+    @contextmanager
+    def operation(self, name):
+        """Time a user-visible operation as a stage, capturing it if a capture is armed.
+
+        Operations nested in another operation of the same thread are timed but never captured.
+        """
+        nested = getattr(self._running, 'active', False)
+        kind = None
+        if not nested:
+            with self._lock:
+                kind, self._armed = self._armed, None
+        self._running.active = True
+        start = time.perf_counter()
+        try:
+            if kind == 'cprofile':
+                with self._cprofile(name):
+                    yield
+            elif kind == 'tracemalloc':
+                with self._tracemalloc(name):
+                    yield
+            else:
+                yield
+        finally:
+            self.record(name, time.perf_counter() - start)
+            self._running.active = nested
+
+    @contextmanager
+    def _cprofile(self, name):
+        import cProfile
+        import pstats
+        profile = cProfile.Profile()
+        profile.enable()
+        try:
+            yield
+        finally:
+            profile.disable()
+            out = io.StringIO()
+            pstats.Stats(profile, stream=out).sort_stats('cumulative').print_stats(CAPTURE_LINES)
+            self._add_capture(name, 'cprofile', out.getvalue())
+
+    @contextmanager
+    def _tracemalloc(self, name):
+        import tracemalloc
+        already_tracing = tracemalloc.is_tracing()
+        if not already_tracing:
+            tracemalloc.start()
+        tracemalloc.reset_peak()
+        before = tracemalloc.take_snapshot()
+        try:
+            yield
+        finally:
+            _, peak = tracemalloc.get_traced_memory()
+            after = tracemalloc.take_snapshot()
+            if not already_tracing:
+                tracemalloc.stop()
+            lines = [f"Peak traced memory: {peak / 1024:.1f} KiB"]
+            lines.extend(str(stat) for stat in after.compare_to(before, 'lineno')[:CAPTURE_LINES])
+            self._add_capture(name, 'tracemalloc', '\n'.join(lines))
+
+    def _add_capture(self, name, kind, report):
+        with self._lock:
+            self.captures.append({'operation': name, 'kind': kind, 'time': time.time(), 'report': report})
+        logger.info("Captured %s of %s", kind, name)
+
+    def rows(self):
+        """Return (stage, StageStats) pairs, the stages with the most total time first."""
+        with self._lock:
+            return sorted(self.stages.items(), key=lambda item: -item[1].total)
+
+    def to_dict(self):
+        with self._lock:
+            stages = {name: stats.to_dict() for name, stats in self.stages.items()}
+            captures = list(self.captures)
+        return {
+            'started': self.started,
+            'exported': time.time(),
+            'python': sys.version.split()[0],
+            'platform': platform.platform(),
+            'stages': stages,
+            'captures': captures,
+        }
+
+    def export_json(self, path):
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(self.to_dict(), f, indent=2)
+
+
+_profiler = None
+
+
+def get_profiler():
+    """Return the add-on's profiler. It collects nothing until it is enabled."""
+    global _profiler
+    if _profiler is None:
+        _profiler = Profiler()
+    return _profiler
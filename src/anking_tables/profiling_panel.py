@@ -0,0 +1,153 @@
+from aqt.utils import showWarning, tooltip
+
+try:
+    from PyQt6.QtCore import Qt, QTimer
+    from PyQt6.QtWidgets import QWidget, QFrame, QVBoxLayout, QHBoxLayout, QToolButton, QTableWidget, \
+        QTableWidgetItem, QPushButton, QComboBox, QTextEdit, QFileDialog
+except (ImportError, AttributeError):
+    from PyQt5.QtCore import Qt, QTimer
+    from PyQt5.QtWidgets import QWidget, QFrame, QVBoxLayout, QHBoxLayout, QToolButton, QTableWidget, \
+        QTableWidgetItem, QPushButton, QComboBox, QTextEdit, QFileDialog
+
+from .profiling import get_profiler
+
+try:
+    RIGHT_ARROW, DOWN_ARROW = Qt.ArrowType.RightArrow, Qt.ArrowType.DownArrow
+    TEXT_BESIDE_ICON = Qt.ToolButtonStyle.ToolButtonTextBesideIcon
+except AttributeError:
+    RIGHT_ARROW, DOWN_ARROW = Qt.RightArrow, Qt.DownArrow
+    TEXT_BESIDE_ICON = Qt.ToolButtonTextBesideIcon
+
+# The open panel is refreshed this often
+REFRESH_MS = 1000
+
+COLUMNS = ("Stage", "Calls", "Total ms", "Mean ms", "Max ms", "Last ms")
+
+
+class PerformancePanel(QWidget):
+    """Collapsible panel with the stage timings of the profiler, one-shot captures and a JSON export."""
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.profiler = get_profiler()
+        # Whether this panel has the profiler enabled: while it is expanded and its window is shown
+        self.profiling = False
+
+        self.toggle_button = QToolButton()
+        self.toggle_button.setText("Performance")
+        self.toggle_button.setToolButtonStyle(TEXT_BESIDE_ICON)
+        self.toggle_button.setArrowType(RIGHT_ARROW)
+        self.toggle_button.setCheckable(True)
+        self.toggle_button.setAutoRaise(True)
+        self.toggle_button.toggled.connect(self.set_expanded)
+
+        self.stage_table = QTableWidget(0, len(COLUMNS))
+        self.stage_table.setHorizontalHeaderLabels(COLUMNS)
+        self.stage_table.verticalHeader().setVisible(False)
+        self.stage_table.setMinimumHeight(120)
+
+        self.capture_combo = QComboBox()
+        self.capture_combo.addItem("cProfile", 'cprofile')
+        self.capture_combo.addItem("Memory (tracemalloc)", 'tracemalloc')
+        self.capture_button = QPushButton("Capture Next Operation")
+        self.capture_button.setToolTip("Profile the next transform, Apply or Apply to All")
+        self.capture_button.clicked.connect(self.arm_capture)
+        reset_button = QPushButton("Reset")
+        reset_button.clicked.connect(self.reset)
+        export_button = QPushButton("Export JSON...")
+        export_button.clicked.connect(self.export_json)
+        buttons = QHBoxLayout()
+        buttons.addWidget(self.capture_combo)
+        buttons.addWidget(self.capture_button)
+        buttons.addStretch(1)
+        buttons.addWidget(reset_button)
+        buttons.addWidget(export_button)
+
+        self.capture_view = QTextEdit()
+        self.capture_view.setReadOnly(True)
+        self.capture_view.setPlaceholderText("The last capture is shown here")
+        self.capture_view.setMinimumHeight(100)
+
+        self.body = QFrame()
+        body_layout = QVBoxLayout(self.body)
+        body_layout.setContentsMargins(0, 0, 0, 0)
+        body_layout.addWidget(self.stage_table)
+        body_layout.addLayout(buttons)
+        body_layout.addWidget(self.capture_view)
+        self.body.setVisible(False)
+
+        layout = QVBoxLayout(self)
+        layout.setContentsMargins(0, 0, 0, 0)
+        layout.addWidget(self.toggle_button)
+        layout.addWidget(self.body)
+
+        self.refresh_timer = QTimer(self)
+        self.refresh_timer.setInterval(REFRESH_MS)
+        self.refresh_timer.timeout.connect(self.refresh)
+
+    def set_profiling(self, profiling):
+        if profiling == self.profiling:
+            return
+        self.profiling = profiling
+        if profiling:
+            self.profiler.enable()
+        else:
+            self.profiler.disable()
+
+    def showEvent(self, event):
+        super().showEvent(event)
+        self.set_profiling(self.toggle_button.isChecked())
+
+    def hideEvent(self, event):
+        super().hideEvent(event)
+        self.set_profiling(False)
+
+    def set_expanded(self, expanded):
+        self.toggle_button.setArrowType(DOWN_ARROW if expanded else RIGHT_ARROW)
+        self.body.setVisible(expanded)
+        self.set_profiling(expanded)
+        if expanded:
+            self.refresh()
+            self.refresh_timer.start()
+        else:
+            self.refresh_timer.stop()
+
+    def refresh(self):
+        rows = self.profiler.rows()
+        self.stage_table.setRowCount(len(rows))
+        for row, (stage, stats) in enumerate(rows):
+            values = stats.to_dict()
+            cells = (stage, str(stats.calls), f"{values['total_ms']:.1f}", f"{values['mean_ms']:.1f}",
+                     f"{values['max_ms']:.1f}", f"{values['last_ms']:.1f}")
+            for column, text in enumerate(cells):
+                self.stage_table.setItem(row, column, QTableWidgetItem(text))
+
+        armed = self.profiler.armed
+        self.capture_button.setText("Capture Armed..." if armed else "Capture Next Operation")
+        captures = self.profiler.captures
+        if captures:
+            last = captures[-1]
+            text = f"{last['kind']} of {last['operation']}\n\n{last['report']}"
+            if self.capture_view.toPlainText() != text:
+                self.capture_view.setPlainText(text)
+
+    def arm_capture(self):
+        self.profiler.capture_next(self.capture_combo.currentData())
+        self.refresh()
+
+    def reset(self):
+        self.profiler.reset()
+        self.capture_view.clear()
+        self.refresh()
+
+    def export_json(self):
+        path, _ = QFileDialog.getSaveFileName(self, "Export Performance Data", "anking_tables_profile.json",
+                                              "JSON files (*.json)")
+        if not path:
+            return
+        try:
+            self.profiler.export_json(path)
+        except OSError as error:
+            showWarning(f"Could not write {path}: {error}", parent=self)
+            return
+        tooltip("Exported the performance data", parent=self)
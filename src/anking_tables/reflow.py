@@ -0,0 +1,114 @@
+import re
+
+from .locate import table_spans, split_tables, splice_tables, inside_tag
+
+# Indentation of one level in the reflowed layout
+INDENT = '  '
+
+# Only ASCII whitespace is layout, a non-breaking space between rows is kept
+_LAYOUT_SPACE = ' \t\n\r\f'
+
+# Tags that make up the layout of a table. Whitespace between them, outside of cells, is not shown by browsers.
+_SECTION_TAGS = frozenset(['thead', 'tbody', 'tfoot', 'caption', 'colgroup'])
+_CELL_TAGS = frozenset(['td', 'th'])
+_CLOSED_BY = {
+    'td': _CELL_TAGS,
+    'th': _CELL_TAGS,
+    'tr': _CELL_TAGS | {'tr'},
+}
+_CLOSED_BY.update((name, _CELL_TAGS | _SECTION_TAGS | {'tr'}) for name in _SECTION_TAGS)
+
+# Same skipping rules as the locator: comments, script and style contents and quoted attribute values
+_TOKEN_RE = re.compile(r'<!--.*?(?:-->|\Z)'
+                       r'|<(script|style)\b.*?(?:</\1\s*>|\Z)'
+                       r'|<(/?)(table|thead|tbody|tfoot|caption|colgroup|col|tr|td|th)\b'
+                       r'(?:[^>"\']|"[^"]*"|\'[^\']*\')*>?',
+                       re.IGNORECASE | re.DOTALL)
+
+
+def _layout_gaps(html):
+    """Yield (start, end, level) of every gap between two layout tags of a table that only holds whitespace.
+
+    Gaps inside cells are never yielded, so cell contents and nested tables are left alone, and neither is the HTML
+    outside of tables. level is the indentation of the tag after the gap. The gaps only depend on the tags, not on
+    the whitespace in them, so reflowing and minifying find the same gaps.
+    """
+    # Open layout tags of the current tables, innermost last
+    stack = []
+    last_end = None
+    for match in _TOKEN_RE.finditer(html):
+        if match.group(3) is None:
+            # Comment, script or style: text between layout tags, so the gap around it is kept
+            last_end = None
+            continue
+        if html[match.start() - 1] != '>' and inside_tag(html, match.start()):
+            # Text of an attribute value
+            continue
+        closing = match.group(2) == '/'
+        name = match.group(3).lower()
+        # The gap belongs to the element open before this tag, whitespace in an open cell is its content
+        in_cell = any(tag in _CELL_TAGS for tag in stack)
+
+        if not closing:
+            # Start tags of cells, rows and sections close the ones left open before them
+            closes = _CLOSED_BY.get(name, ())
+            while stack and stack[-1] in closes:
+                stack.pop()
+            level = len(stack)
+        elif name in stack:
+            # An end tag is indented like its start tag
+            level = len(stack) - 1 - stack[::-1].index(name)
+        else:
+            level = len(stack)
+
+        if last_end is not None and not in_cell and not html[last_end:match.start()].strip(_LAYOUT_SPACE):
+            yield last_end, match.start(), level
+
+        if closing:
+            if name in stack:
+                del stack[level:]
+        elif name != 'col':
+            stack.append(name)
+        # Gaps are only looked at inside a table
+        last_end = match.end() if stack else None
+
+
+def _replace_gaps(html, replacement):
+    parts = []
+    last = 0
+    for start, end, level in _layout_gaps(html):
+        parts.append(html[last:start])
+        parts.append(replacement(level))
+        last = end
+    if not parts:
+        return html
+    parts.append(html[last:])
+    return ''.join(parts)
+
+
+def reflow_html(html):
+    """Put every row and cell of the tables on its own line, indented by nesting. Only whitespace is changed."""
+    return _replace_gaps(html, lambda level: '\n' + INDENT * level)
+
+
+def minify_html(html):
+    """Remove the whitespace between the layout tags of the tables, the compact form the tables are stored in."""
+    return _replace_gaps(html, lambda level: '')
+
+
+def compact_edited_tables(edited_html, original_html):
+    """Return the editor text to store after editing in the reflowed layout.
+
+    Every table is minified, except tables whose only change is layout whitespace: those get their original HTML
+    back, byte for byte, so reflowing and applying an untouched table never rewrites it. The tables are located with
+    table_spans, the text between them is left as it is.
+    """
+    spans = table_spans(edited_html)
+    original_tables = split_tables(original_html)
+    if len(spans) != len(original_tables):
+        return minify_html(edited_html)
+    replacements = {}
+    for position, ((start, end), original) in enumerate(zip(spans, original_tables)):
+        edited = minify_html(edited_html[start:end])
+        replacements[position] = original if edited == minify_html(original) else edited
+    return splice_tables(edited_html, spans, replacements)
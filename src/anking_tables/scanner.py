@@ -0,0 +1,61 @@
+from .locate import table_spans, has_table
+
+FIELD_SEPARATOR = '\x1f'
+
+# Notes fetched from the collection per query. Only one batch of field contents is in memory at a time.
+SCAN_BATCH_SIZE = 500
+
+# SQLite's like is case-insensitive for ASCII, so this also keeps fields with <TABLE
+_TABLE_FILTER = "flds like '%<table%'"
+
+
+def note_batches(col, since=0, note_ids=None, batch_size=SCAN_BATCH_SIZE):
+    """Yield lists of (note id, mtime, flds) of the notes with a table, read straight from the notes table.
+
+    No Note objects are built. The whole collection is paged by note id, so every query uses the primary key and
+    returns at most batch_size rows; with note_ids only those notes are read. since skips notes modified before it.
+    """
+    if note_ids is not None:
+        note_ids = sorted(note_ids)
+        for start in range(0, len(note_ids), batch_size):
+            batch = note_ids[start:start + batch_size]
+            placeholders = ', '.join('?' * len(batch))
+            rows = col.db.all(f"select id, mod, flds from notes where id in ({placeholders}) and mod >= ? "
+                              f"and {_TABLE_FILTER} order by id", *batch, since)
+            if rows:
+                yield rows
+        return
+
+    last_id = None
+    while True:
+        if last_id is None:
+            rows = col.db.all(f"select id, mod, flds from notes where mod >= ? and {_TABLE_FILTER} order by id limit ?",
+                              since, batch_size)
+        else:
+            rows = col.db.all(f"select id, mod, flds from notes where id > ? and mod >= ? and {_TABLE_FILTER} "
+                              f"order by id limit ?", last_id, since, batch_size)
+        if not rows:
+            return
+        yield rows
+        if len(rows) < batch_size:
+            return
+        last_id = rows[-1][0]
+
+
+def table_fields(col, since=0, note_ids=None, batch_size=SCAN_BATCH_SIZE):
+    """Yield (note id, mtime, field index, field HTML) of every field with a table."""
+    for rows in note_batches(col, since, note_ids, batch_size):
+        for note_id, mod, flds in rows:
+            for field_idx, field_html in enumerate(flds.split(FIELD_SEPARATOR)):
+                if has_table(field_html):
+                    yield note_id, mod, field_idx, field_html
+
+
+def scan_tables(col, since=0, note_ids=None, batch_size=SCAN_BATCH_SIZE):
+    """Yield (note id, field index, (start, end)) for every top-level table in the collection.
+
+    The spans are character offsets into the field HTML found by the regex locator, nothing is parsed.
+    """
+    for note_id, _, field_idx, field_html in table_fields(col, since, note_ids, batch_size):
+        for span in table_spans(field_html):
+            yield note_id, field_idx, span
@@ -0,0 +1,117 @@
+import hashlib
+import re
+from array import array
+from collections import defaultdict
+
+# Number of smallest shingle hashes kept per table (bottom-k MinHash)
+SIGNATURE_SIZE = 64
+
+# Number of consecutive words in a shingle
+SHINGLE_WORDS = 3
+
+DEFAULT_THRESHOLD = 0.5
+
+_WORD_RE = re.compile(r'\w+')
+
+
+def table_words(table):
+    """Return the lowercased words of a table's cell text."""
+    return _WORD_RE.findall(table.get_text(' ').lower())
+
+
+def _hash(text):
+    return int.from_bytes(hashlib.blake2b(text.encode('utf-8'), digest_size=8).digest(), 'little')
+
+
+def table_signature(table):
+    """Return the bottom-k MinHash signature of a table's word shingles as a sorted tuple of hashes."""
+    words = table_words(table)
+    if len(words) < SHINGLE_WORDS:
+        shingles = set(words)
+    else:
+        shingles = {' '.join(words[i:i + SHINGLE_WORDS]) for i in range(len(words) - SHINGLE_WORDS + 1)}
+    return tuple(sorted(_hash(shingle) for shingle in shingles)[:SIGNATURE_SIZE])
+
+
+def pack_signature(signature):
+    return array('Q', signature).tobytes()
+
+
+def unpack_signature(blob):
+    packed = array('Q')
+    packed.frombytes(blob)
+    return tuple(packed)
+
+
+def estimate_similarity(first, second):
+    """Estimate the Jaccard similarity of the shingle sets behind two signatures."""
+    if not first or not second:
+        return 0.0
+    size = min(len(first), len(second))
+    shared = set(first).intersection(second)
+    # The smallest hashes of the union are a uniform sample of it, count how many of them both tables have
+    union_sample = sorted(set(first).union(second))[:size]
+    return sum(1 for value in union_sample if value in shared) / len(union_sample)
+
+
+class SimilarTableFinder:
+    """In-memory search over the table signatures stored in the table index.
+
+    The signatures are loaded from the index once. Later refreshes only reload the notes the index's change log lists
+    as changed since, and everything only when the log does not reach back that far.
+    """
+
+    def __init__(self):
+        self._generation = None
+        # (note id, field index, table position) -> signature
+        self._signatures = {}
+        # hash -> keys of the tables whose signature contains it
+        self._postings = defaultdict(set)
+        # note id -> keys of its tables
+        self._note_keys = defaultdict(list)
+
+    def refresh(self, index):
+        """Bring the signatures up to date with the index."""
+        note_ids, generation = index.changed_notes(self._generation)
+        if generation == self._generation:
+            return
+        if note_ids is None:
+            self._signatures = {}
+            self._postings = defaultdict(set)
+            self._note_keys = defaultdict(list)
+            rows = index.signatures()
+        else:
+            for note_id in note_ids:
+                self._remove_note(note_id)
+            rows = index.signatures(note_ids)
+        for note_id, field_idx, position, blob in rows:
+            key = (note_id, field_idx, position)
+            signature = unpack_signature(blob)
+            self._signatures[key] = signature
+            self._note_keys[note_id].append(key)
+            for value in signature:
+                self._postings[value].add(key)
+        self._generation = generation
+
+    def _remove_note(self, note_id):
+        for key in self._note_keys.pop(note_id, ()):
+            for value in self._signatures.pop(key):
+                postings = self._postings[value]
+                postings.discard(key)
+                if not postings:
+                    del self._postings[value]
+
+    def find_similar(self, signature, threshold=DEFAULT_THRESHOLD, limit=None):
+        """Return [(similarity, note id, field index, table position)] above threshold, most similar first."""
+        shared_counts = defaultdict(int)
+        for value in signature:
+            for key in self._postings.get(value, ()):
+                shared_counts[key] += 1
+
+        matches = []
+        for key in shared_counts:
+            similarity = estimate_similarity(signature, self._signatures[key])
+            if similarity >= threshold:
+                matches.append((similarity,) + key)
+        matches.sort(key=lambda match: (-match[0], match[1:]))
+        return matches[:limit] if limit else matches
@@ -0,0 +1,284 @@
+import os
+import sqlite3
+import threading
+from concurrent.futures.process import BrokenProcessPool
+from contextlib import closing
+
+from bs4 import BeautifulSoup
+
+from .canonical import table_fingerprint, cluster_key
+from .log import get_logger
+from .similarity import table_signature, pack_signature
+from .audit import audit_table, pack_violations
+from .scanner import FIELD_SEPARATOR, note_batches
+from .locate import split_tables
+from .bulk_normalize import process_pool
+
+logger = get_logger("table_index")
+
+# Bump when the fingerprint or the stored columns change so existing indexes are rebuilt
+SCHEMA_VERSION = 9
+
+
+def field_tables(field_html):
+    """Return the fingerprint, cluster key, similarity signature and format violations of every top-level table.
+
+    Only the table substrings found by the locator are parsed, the rest of the field never is.
+    """
+    rows = []
+    for table_html in split_tables(field_html):
+        table = BeautifulSoup(table_html, 'html.parser').table
+        rows.append((table_fingerprint(table), cluster_key(table), table_signature(table), audit_table(table)))
+    return rows
+
+
+def _note_tables(flds):
+    # Runs in the worker processes of a parallel build, so it only takes and returns plain values
+    return [(field_idx, field_tables(field_html)) for field_idx, field_html in enumerate(flds.split(FIELD_SEPARATOR))]
+
+
+# Notes handed to a worker process at a time
+WORKER_CHUNK_SIZE = 16
+
+# Generations whose changed notes are kept in the change log, older readers reload everything
+MAX_LOGGED_GENERATIONS = 500
+
+# Note ids per query when reading or deleting the rows of some notes
+ID_BATCH_SIZE = 500
+
+# One sync at a time per index file: the index is synced from several background operations
+_sync_locks = {}
+_sync_locks_guard = threading.Lock()
+
+
+def _sync_lock(path):
+    with _sync_locks_guard:
+        return _sync_locks.setdefault(os.path.abspath(path), threading.Lock())
+
+
+def _batches(items, size=ID_BATCH_SIZE):
+    items = list(items)
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+class TableIndex:
+    """Sidecar SQLite index mapping table fingerprints to the notes and fields that contain them.
+
+    The modification time of every note is stored when it is indexed, and a sync re-reads the notes whose mtime
+    differs from the stored one. Notes that arrive from AnkiWeb with an older mtime are found too, which a single
+    newest-mtime mark would miss.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with closing(self._connect()) as db:
+            self._create_schema(db)
+
+    def _connect(self):
+        # A fresh connection per call keeps the index usable from background threads
+        return sqlite3.connect(self.path)
+
+    def _create_schema(self, db):
+        db.execute("create table if not exists meta (key text primary key, value integer)")
+        version = self._get_meta(db, 'schema')
+        if version != SCHEMA_VERSION:
+            db.execute("drop table if exists tables")
+            db.execute("drop table if exists notes")
+            db.execute("drop table if exists changes")
+            db.execute("delete from meta")
+            self._set_meta(db, 'schema', SCHEMA_VERSION)
+        db.execute("create table if not exists tables (nid integer not null, ord integer not null, pos integer not null, "
+                   "hash text not null, cluster text not null, signature blob not null, violations text not null, "
+                   "primary key (nid, ord, pos))")
+        # Modification time of every indexed note, with or without tables
+        db.execute("create table if not exists notes (nid integer primary key, mod integer not null)")
+        # Notes whose tables changed in each generation, so readers of the index can update only those
+        db.execute("create table if not exists changes (generation integer not null, nid integer not null)")
+        db.execute("create index if not exists changes_generation on changes (generation)")
+        db.execute("create index if not exists tables_hash on tables (hash)")
+        db.execute("create index if not exists tables_cluster on tables (cluster)")
+        db.commit()
+
+    @staticmethod
+    def _get_meta(db, key):
+        row = db.execute("select value from meta where key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    @staticmethod
+    def _set_meta(db, key, value):
+        db.execute("insert or replace into meta (key, value) values (?, ?)", (key, value))
+
+    def is_built(self):
+        with closing(self._connect()) as db:
+            return self._get_meta(db, 'built') is not None
+
+    def generation(self):
+        """Return a number that changes whenever the indexed tables change."""
+        with closing(self._connect()) as db:
+            return self._get_meta(db, 'generation') or 0
+
+    def _bump_generation(self, db, note_ids=None):
+        """Start a new generation in which the tables of note_ids changed, or all of them when None."""
+        generation = (self._get_meta(db, 'generation') or 0) + 1
+        self._set_meta(db, 'generation', generation)
+        if note_ids is None:
+            db.execute("delete from changes")
+            self._set_meta(db, 'log_start', generation)
+            return
+        db.executemany("insert into changes (generation, nid) values (?, ?)", ((generation, nid) for nid in note_ids))
+        if generation - (self._get_meta(db, 'log_start') or 0) > MAX_LOGGED_GENERATIONS:
+            log_start = generation - MAX_LOGGED_GENERATIONS
+            db.execute("delete from changes where generation <= ?", (log_start,))
+            self._set_meta(db, 'log_start', log_start)
+
+    def changed_notes(self, since):
+        """Return the ids of the notes whose tables changed after generation since, and the current generation.
+
+        The ids are None when the change log does not reach back that far, after a rebuild for example, and everything
+        has to be read again.
+        """
+        with closing(self._connect()) as db:
+            generation = self._get_meta(db, 'generation') or 0
+            if since is None or since < (self._get_meta(db, 'log_start') or 0):
+                return None, generation
+            note_ids = {nid for nid, in db.execute("select nid from changes where generation > ?", (since,))}
+            return note_ids, generation
+
+    @staticmethod
+    def _changed_notes(col, db):
+        """Return {note id: mtime} of the notes that are new or modified since they were indexed, and the ids of the
+        indexed notes that no longer exist."""
+        indexed = dict(db.execute("select nid, mod from notes"))
+        changed = {}
+        for nid, mod in col.db.all("select id, mod from notes"):
+            if indexed.pop(nid, None) != mod:
+                changed[nid] = mod
+        return changed, list(indexed)
+
+    @staticmethod
+    def _delete_notes(db, note_ids):
+        """Delete the rows of some notes, returning (note id, field index, table position, fingerprint) of each."""
+        rows = set()
+        for batch in _batches(note_ids):
+            placeholders = ', '.join('?' * len(batch))
+            rows.update(db.execute(f"select nid, ord, pos, hash from tables where nid in ({placeholders})", batch))
+            db.execute(f"delete from tables where nid in ({placeholders})", batch)
+            db.execute(f"delete from notes where nid in ({placeholders})", batch)
+        return rows
+
+    def sync(self, col, workers=1):
+        """Index every note added or modified since it was last indexed and drop the deleted ones. Returns the
+        number of notes with tables that were indexed.
+
+        Notes are read in batches by the scanner, so memory use does not grow with the collection. With more than one
+        worker the first build parses the notes in a process pool, later syncs only read a few notes and stay in this
+        process. Concurrent syncs of the same index run one after the other, a later one finds little left to do.
+        """
+        with _sync_lock(self.path), closing(self._connect()) as db:
+            first_build = self._get_meta(db, 'built') is None
+            if first_build:
+                db.execute("delete from tables")
+                db.execute("delete from notes")
+            changed, deleted = self._changed_notes(col, db)
+            old_rows = set() if first_build else self._delete_notes(db, list(changed) + deleted)
+
+            count = 0
+            new_rows = set()
+            executor = process_pool(workers) if first_build else None
+            try:
+                # The first build pages through the whole collection, later syncs read the changed notes by id
+                batches = note_batches(col) if first_build else note_batches(col, note_ids=changed)
+                for notes in batches:
+                    results = None
+                    if executor is not None:
+                        try:
+                            results = list(executor.map(_note_tables, (flds for _, _, flds in notes),
+                                                        chunksize=WORKER_CHUNK_SIZE))
+                        except BrokenProcessPool as error:
+                            logger.warning("Worker processes failed, indexing in this process: %s", error)
+                            executor.shutdown(cancel_futures=True)
+                            executor = None
+                    if results is None:
+                        results = [_note_tables(flds) for _, _, flds in notes]
+
+                    for (nid, mod, _), note_tables in zip(notes, results):
+                        count += 1
+                        # The mtime read with the fields, in case the note changed after the mtimes were listed
+                        changed[nid] = mod
+                        for field_idx, tables in note_tables:
+                            for position, (fingerprint, cluster, signature, violations) in enumerate(tables):
+                                db.execute("insert or replace into tables (nid, ord, pos, hash, cluster, signature, "
+                                           "violations) values (?, ?, ?, ?, ?, ?, ?)",
+                                           (nid, field_idx, position, fingerprint, cluster, pack_signature(signature),
+                                            pack_violations(violations)))
+                                new_rows.add((nid, field_idx, position, fingerprint))
+            finally:
+                if executor is not None:
+                    executor.shutdown()
+
+            # Notes without tables are stored too, so they are only read again once they change
+            db.executemany("insert or replace into notes (nid, mod) values (?, ?)", changed.items())
+            self._set_meta(db, 'built', 1)
+            # Re-reading notes whose tables did not change leaves the generation alone
+            if first_build:
+                self._bump_generation(db)
+            elif new_rows != old_rows:
+                self._bump_generation(db, {row[0] for row in new_rows ^ old_rows})
+            db.commit()
+        logger.debug("Indexed %d notes with tables of %d changed notes, %d deleted", count, len(changed), len(deleted))
+        return count
+
+    def lookup(self, fingerprints):
+        """Return the (note id, field index) pairs containing any of the given table fingerprints."""
+        return self._lookup('hash', fingerprints)
+
+    def lookup_clusters(self, clusters):
+        """Return the (note id, field index) pairs containing a table of any of the given clusters."""
+        return self._lookup('cluster', clusters)
+
+    def _lookup(self, column, keys):
+        keys = list(set(keys))
+        if not keys:
+            return []
+        placeholders = ', '.join('?' * len(keys))
+        with closing(self._connect()) as db:
+            return db.execute(f"select distinct nid, ord from tables where {column} in ({placeholders}) "
+                              f"order by nid, ord", keys).fetchall()
+
+    def clusters(self, min_tables=2):
+        """Return (cluster key, tables, notes) of every cluster with at least min_tables tables, largest first."""
+        with closing(self._connect()) as db:
+            return db.execute("select cluster, count(*), count(distinct nid) from tables group by cluster "
+                              "having count(*) >= ? order by count(*) desc, cluster", (min_tables,)).fetchall()
+
+    def cluster_members(self, cluster):
+        """Return (note id, field index, table position) of every table of a cluster."""
+        with closing(self._connect()) as db:
+            return db.execute("select nid, ord, pos from tables where cluster = ? order by nid, ord, pos",
+                              (cluster,)).fetchall()
+
+    def signatures(self, note_ids=None):
+        """Return (note id, field index, table position, packed signature) for every indexed table, or for the
+        tables of some notes."""
+        with closing(self._connect()) as db:
+            if note_ids is None:
+                return db.execute("select nid, ord, pos, signature from tables").fetchall()
+            rows = []
+            for batch in _batches(note_ids):
+                placeholders = ', '.join('?' * len(batch))
+                rows.extend(db.execute(f"select nid, ord, pos, signature from tables where nid in ({placeholders})",
+                                       batch))
+            return rows
+
+    def violations(self):
+        """Return (note id, field index, table position, packed violation codes) for every indexed table."""
+        with closing(self._connect()) as db:
+            return db.execute("select nid, ord, pos, violations from tables order by nid, ord, pos").fetchall()
+
+    def forget_notes(self, note_ids):
+        """Remove notes that no longer exist from the index."""
+        with _sync_lock(self.path), closing(self._connect()) as db:
+            self._delete_notes(db, note_ids)
+            self._bump_generation(db, note_ids)
+            db.commit()
@@ -0,0 +1,142 @@
+from aqt import mw
+from aqt.operations import CollectionOp, QueryOp
+from aqt.utils import showWarning, tooltip
+
+try:
+    from PyQt6.QtCore import Qt
+    from PyQt6.QtWidgets import QDialog, QVBoxLayout, QHBoxLayout, QLabel, QListWidget, QListWidgetItem, QLineEdit, \
+        QPushButton, QAbstractItemView
+except (ImportError, AttributeError):
+    from PyQt5.QtCore import Qt
+    from PyQt5.QtWidgets import QDialog, QVBoxLayout, QHBoxLayout, QLabel, QListWidget, QListWidgetItem, QLineEdit, \
+        QPushButton, QAbstractItemView
+
+from .log import get_logger
+from .tags import merge_table_tags, table_tag
+from .utils import get_tag_registry, invalidate_tag_registry, search_text
+
+logger = get_logger("tag_dialog")
+
+try:
+    NAME_ROLE = Qt.ItemDataRole.UserRole
+    EXTENDED_SELECTION = QAbstractItemView.SelectionMode.ExtendedSelection
+except AttributeError:
+    NAME_ROLE = Qt.UserRole
+    EXTENDED_SELECTION = QAbstractItemView.ExtendedSelection
+
+
+class TagDialog(QDialog):
+    """Lists the table tags with their note counts and merges or renames the selected ones."""
+
+    def __init__(self, parent=None):
+        super().__init__(parent or mw)
+        self.setWindowTitle("Table Tags")
+        self.setMinimumWidth(420)
+        self.registry = None
+        self.duplicate_groups = []
+        self.next_group = 0
+
+        self.summary_label = QLabel("Reading tags...")
+        self.summary_label.setWordWrap(True)
+        self.tag_list = QListWidget()
+        self.tag_list.setSelectionMode(EXTENDED_SELECTION)
+        self.tag_list.itemSelectionChanged.connect(self.on_selection_changed)
+        self.tag_list.itemDoubleClicked.connect(self.browse)
+
+        self.target_edit = QLineEdit()
+        self.target_edit.setPlaceholderText("New tag name")
+        self.merge_button = QPushButton("Merge / Rename")
+        self.merge_button.setToolTip("Give every note with one of the selected tags the new tag instead")
+        self.merge_button.clicked.connect(self.merge)
+        target_row = QHBoxLayout()
+        target_row.addWidget(self.target_edit)
+        target_row.addWidget(self.merge_button)
+
+        duplicates_button = QPushButton("Next Near-Duplicates")
+        duplicates_button.setToolTip("Select the next group of tags that only differ in case, spaces, underscores "
+                                     "or dashes")
+        duplicates_button.clicked.connect(self.select_next_duplicates)
+        browse_button = QPushButton("Browse")
+        browse_button.clicked.connect(self.browse)
+        close_button = QPushButton("Close")
+        close_button.clicked.connect(self.close)
+        buttons = QHBoxLayout()
+        buttons.addWidget(duplicates_button)
+        buttons.addWidget(browse_button)
+        buttons.addStretch(1)
+        buttons.addWidget(close_button)
+
+        layout = QVBoxLayout(self)
+        layout.addWidget(self.summary_label)
+        layout.addWidget(self.tag_list)
+        layout.addLayout(target_row)
+        layout.addLayout(buttons)
+
+    def load(self):
+        QueryOp(parent=self, op=get_tag_registry, success=self.show_registry).run_in_background()
+
+    def show_registry(self, registry):
+        self.registry = registry
+        self.duplicate_groups = registry.near_duplicates()
+        self.next_group = 0
+        self.summary_label.setText(f"{len(registry.counts)} table tags, {len(self.duplicate_groups)} groups of "
+                                   f"near-duplicates.")
+        self.tag_list.clear()
+        for name, count in sorted(registry.counts.items(), key=lambda item: item[0].lower()):
+            item = QListWidgetItem(f"{name} ({count})")
+            item.setData(NAME_ROLE, name)
+            self.tag_list.addItem(item)
+
+    def selected_names(self):
+        return [item.data(NAME_ROLE) for item in self.tag_list.selectedItems()]
+
+    def on_selection_changed(self):
+        names = self.selected_names()
+        if names and self.registry is not None:
+            # Suggest the most used of the selected tags as the name to keep
+            self.target_edit.setText(max(names, key=lambda name: self.registry.counts[name]))
+
+    def select_next_duplicates(self):
+        if not self.duplicate_groups:
+            tooltip("No near-duplicate tags", parent=self)
+            return
+        group = set(self.duplicate_groups[self.next_group % len(self.duplicate_groups)])
+        self.next_group += 1
+        self.tag_list.clearSelection()
+        for row in range(self.tag_list.count()):
+            item = self.tag_list.item(row)
+            if item.data(NAME_ROLE) in group:
+                item.setSelected(True)
+                self.tag_list.scrollToItem(item)
+
+    def browse(self, *args):
+        names = self.selected_names()
+        if names:
+            search_text(" or ".join(f'"tag:{table_tag(name)}"' for name in names))
+
+    def merge(self):
+        names = self.selected_names()
+        target = self.target_edit.text().strip().replace(' ', '_')
+        if not names or not target or names == [target]:
+            tooltip("Select the tags to merge and enter the new name", parent=self)
+            return
+
+        def on_success(changes):
+            tooltip(f"Updated the tags of {changes.count} notes", parent=self)
+            invalidate_tag_registry()
+            self.load()
+
+        def on_failure(error):
+            logger.error("Merging table tags failed: %s", error)
+            showWarning(f"Merging table tags failed: {error}", parent=self)
+
+        logger.info("Merging table tags %s into %s", names, target)
+        # One backend operation, so the whole merge is a single undo step
+        CollectionOp(parent=self, op=lambda col: merge_table_tags(col, names, target)).success(on_success) \
+            .failure(on_failure).run_in_background()
+
+
+def open_tag_dialog():
+    dialog = TagDialog(mw)
+    dialog.show()
+    dialog.load()
@@ -0,0 +1,139 @@
+import re
+from bisect import bisect_left
+from collections import Counter
+
+from .log import get_logger
+
+logger = get_logger("tags")
+
+TABLE_TAG_PREFIX = '!AK_UpdateTags::Table::'
+
+# Suggestions offered by complete()
+MAX_SUGGESTIONS = 20
+
+_SEPARATORS = re.compile(r'[\s_\-]+')
+
+
+def table_tag(name):
+    """Return the full tag for a table tag name, spaces become underscores like in the tag field."""
+    return TABLE_TAG_PREFIX + name.replace(' ', '_')
+
+
+def table_tag_name(tag):
+    """Return the name of a table tag, or None if the tag is not a table tag."""
+    if tag.lower().startswith(TABLE_TAG_PREFIX.lower()):
+        return tag[len(TABLE_TAG_PREFIX):]
+    return None
+
+
+def _folded(name):
+    # Names that only differ in case, spaces, underscores or dashes are near-duplicates
+    return _SEPARATORS.sub('', name.lower())
+
+
+def _subsequence_score(query, name):
+    """Return how well the letters of query appear in order in name (higher is better), or None."""
+    position = 0
+    gaps = 0
+    for char in query:
+        found = name.find(char, position)
+        if found < 0:
+            return None
+        gaps += found - position
+        position = found + 1
+    return -gaps
+
+
+class TagRegistry:
+    """Every table tag of the collection with the number of notes that have it.
+
+    The registry is built with one query over the tags column of the notes table and then kept current from the
+    tags of the notes the editor saves, so suggestions never query the collection.
+    """
+
+    def __init__(self):
+        self.counts = Counter()
+        self._sorted = []
+        self._sorted_keys = []
+
+    def build(self, col):
+        counts = Counter()
+        for tags, in col.db.all("select tags from notes where tags like ?", f"%{TABLE_TAG_PREFIX}%"):
+            for tag in tags.split():
+                name = table_tag_name(tag)
+                if name:
+                    counts[name] += 1
+        self.counts = counts
+        self._reindex()
+        logger.debug("Tag registry: %d table tags", len(counts))
+        return self
+
+    def _reindex(self):
+        self._sorted = sorted(self.counts, key=str.lower)
+        self._sorted_keys = [name.lower() for name in self._sorted]
+
+    def update_note(self, old_tags, new_tags):
+        """Update the counts after a note's tags changed from old_tags to new_tags."""
+        old_names = {table_tag_name(tag) for tag in old_tags} - {None}
+        new_names = {table_tag_name(tag) for tag in new_tags} - {None}
+        if old_names == new_names:
+            return
+        for name in old_names - new_names:
+            self.counts[name] -= 1
+            if self.counts[name] <= 0:
+                del self.counts[name]
+        for name in new_names - old_names:
+            self.counts[name] += 1
+        self._reindex()
+
+    def complete(self, text, limit=MAX_SUGGESTIONS):
+        """Return table tag names for the text typed in the tag field, best first.
+
+        Names starting with the text come first, most used first, then names containing its letters in order.
+        """
+        query = text.strip().replace(' ', '_').lower()
+        if not query:
+            return [name for name, _ in self.counts.most_common(limit)]
+        start = bisect_left(self._sorted_keys, query)
+        prefixed = []
+        for index in range(start, len(self._sorted)):
+            if not self._sorted_keys[index].startswith(query):
+                break
+            prefixed.append(self._sorted[index])
+        prefixed.sort(key=lambda name: -self.counts[name])
+        if len(prefixed) >= limit:
+            return prefixed[:limit]
+
+        taken = set(prefixed)
+        fuzzy = []
+        for name, key in zip(self._sorted, self._sorted_keys):
+            if name in taken:
+                continue
+            score = _subsequence_score(query, key)
+            if score is not None:
+                fuzzy.append((-score, -self.counts[name], name))
+        fuzzy.sort()
+        return prefixed + [name for _, _, name in fuzzy[:limit - len(prefixed)]]
+
+    def near_duplicates(self):
+        """Return groups of names that only differ in case, spaces, underscores or dashes, most used first."""
+        groups = {}
+        for name in self.counts:
+            groups.setdefault(_folded(name), []).append(name)
+        return [sorted(names, key=lambda name: -self.counts[name]) for names in groups.values() if len(names) > 1]
+
+
+def merge_table_tags(col, names, target):
+    """Rename the table tags names to target on every note that has them, as one collection operation.
+
+    Notes that had several of the names end up with target once. Returns the OpChangesWithCount of the operation.
+    Raises ValueError when every name already is target.
+    """
+    sources = [table_tag(name) for name in names if name != target]
+    if not sources:
+        raise ValueError(f"There is nothing to merge, the tags already are {target}")
+    query = " or ".join(f'"tag:{tag}"' for tag in sources)
+    note_ids = col.find_notes(query)
+    pattern = '^(?:' + '|'.join(re.escape(tag) for tag in sources) + ')$'
+    return col.tags.find_and_replace(note_ids=note_ids, search=pattern, replacement=table_tag(target), regex=True,
+                                     match_case=False)
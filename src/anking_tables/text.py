@@ -0,0 +1,30 @@
+import re
+
+from bs4 import NavigableString
+
+from .parse_cache import parse_html, view_html
+
+
+def extract_html_text(initial_html):
+    soup = parse_html(initial_html)
+
+    # Normalize whitespace within tags
+    for tag in soup.find_all(text=True):
+        tag.replace_with(tag.strip())
+
+    # Insert spaces between tags and text
+    for tag in soup.find_all():
+        if tag.next_sibling and isinstance(tag.next_sibling, NavigableString):
+            tag.next_sibling.replace_with(' ' + tag.next_sibling)
+
+    text = soup.get_text(separator=' ')
+    extracted_text = re.sub(r'\s+', ' ', text).strip()
+
+    # Calculate the midpoint and return the first half
+    midpoint = len(extracted_text) // 2
+    return extracted_text[:midpoint]
+
+
+def contains_credits(html):
+    soup = view_html(html)
+    return "Photo credit: " in soup.text
@@ -1,131 +1,15 @@
+import os
+
 from aqt import mw, dialogs
+from aqt.operations import QueryOp
+
+from .log import get_logger
+
+logger = get_logger("utils")
 
-from bs4 import BeautifulSoup
-
-try:
-    from PyQt6.QtCore import QObject, QEvent, Qt
-except ImportError:
-    from PyQt5.QtCore import QObject, QEvent, Qt
-
-
-def parse_html(html):
-    # Parse the HTML with BeautifulSoup
-    soup = BeautifulSoup(html, 'html.parser')
-
-    return soup
-
-
-def process_table(table):
-    """Process a table element to remove all styling and set the class to 'one' and border to '1'."""
-    # Remove all attributes from the table
-    table.attrs = {}
-
-    # Set the class of the table to 'one'
-    table['class'] = ['one']
-
-    # Set the 'border' attribute of the table to '1'
-    table['border'] = '1'
-
-    # Process all elements in the table
-    for element in table.find_all(True):  # True matches all elements
-        # Preserve colspan and rowspan attributes
-        colspan = element.get('colspan')
-        rowspan = element.get('rowspan')
-
-        # Preserve src, height, and width attributes for img tags
-        src = element.get('src') if element.name == 'img' else None
-        height = element.get('height') if element.name == 'img' else None
-        width = element.get('width') if element.name == 'img' else None
-
-        # Remove all attributes from the element
-        element.attrs = {}
-
-        # Restore colspan and rowspan attributes
-        if colspan:
-            element['colspan'] = colspan
-        if rowspan:
-            element['rowspan'] = rowspan
-
-        # Restore src, height, and width attributes for img tags
-        if src:
-            element['src'] = src
-        if height:
-            element['height'] = height
-        if width:
-            element['width'] = width
-
-    # Remove all tags that are not listed
-    for tag in table.find_all(True):  # True matches all elements
-        if tag.name not in ['table', 'tbody', 'tr', 'td', 'th', 'br', 'b', 'u', 'i', 'ul', 'li', 'ol', 'img', 'sub', 'sup', 'a']:
-            tag.unwrap()
-
-    # Convert rows that span across the whole table to td
-    for row in table.find_all('tr'):
-        cells = row.find_all(['td', 'th'])
-        if len(cells) == 1 and cells[0].get('colspan'):  # If the row is merged across the whole table
-            # Convert the row to td
-            for cell in cells:
-                cell.name = 'td'
-
-    # Convert the first row of cells into header cells
-    first_row = table.find('tr')
-    skip_rows = 1
-    if first_row:
-        cells = first_row.find_all(['td', 'th'])
-        if len(cells) == 1 and cells[0].get('colspan'):  # If the first row is merged across the whole table
-            # Treat the second row as the header row
-            second_row = first_row.find_next_sibling('tr')
-            if second_row:
-                for cell in second_row.find_all('td'):
-                    cell.name = 'th'
-                    # Remove <b>, <u>, and <i> tags from the cell
-                    for tag in cell.find_all(['b', 'u', 'i']):
-                        tag.unwrap()
-            skip_rows = 2
-        else:
-            for cell in cells:
-                cell.name = 'th'
-                # Remove <b>, <u>, and <i> tags from the cell
-                for tag in cell.find_all(['b', 'u', 'i']):
-                    tag.unwrap()
-    return skip_rows
-
-
-def deheader_first_column(editor, soup):
-    for table in soup.find_all('table'):
-        skip_rows = process_table(table)
-        for row in table.find_all('tr')[skip_rows:]:
-            first_cell = row.find(['th', 'td'])
-            if first_cell:
-                first_cell.name = 'td'
-
-
-def headerize_first_column(editor, soup):
-    for table in soup.find_all('table'):
-        for row in table.find_all('tr'):
-            first_cell = row.find(['td', 'th'])
-            if first_cell and first_cell.name == 'td':
-                # Check if the row spans the entire table
-                cells = row.find_all(['td', 'th'])
-                if any(cell.get('colspan') for cell in cells):
-                    # If the row spans the entire table, skip this row
-                    continue
-                # Check if the first cell is part of a row span
-                previous_row = row.find_previous_sibling('tr')
-                if previous_row:
-                    previous_row_first_cell = previous_row.find(['td', 'th'])
-                    if previous_row_first_cell and previous_row_first_cell.get('rowspan'):
-                        # If the first cell is part of a row span, skip this row
-                        continue
-                if not row.find('th'):
-                    first_cell.name = 'th'
-                    for tag in first_cell.find_all(['b', 'u', 'i']):
-                        tag.unwrap()
-
-
-def contains_credits(html):
-    soup = BeautifulSoup(html, 'html.parser')
-    return "Photo credit: " in soup.text
+
+def get_config():
+    return mw.addonManager.getConfig(__name__) or {}
 
 
 def is_night_mode():
@@ -135,4 +19,77 @@ def is_night_mode():
 def search_text(text):
     browser = dialogs.open("Browser", mw)
     browser.form.searchEdit.lineEdit().setText(text)
-    browser.onSearchActivated()
\ No newline at end of file
+    browser.onSearchActivated()
+
+
+def user_files_path(*parts):
+    """Return a path inside the add-on's user_files folder, which Anki keeps across add-on updates."""
+    path = os.path.join(os.path.dirname(__file__), 'user_files')
+    os.makedirs(path, exist_ok=True)
+    return os.path.join(path, *parts)
+
+
+_table_index = None
+_table_index_profile = None
+_table_index_sync_running = False
+_similar_table_finder = None
+
+
+def get_table_index():
+    """Return the table index of the current profile."""
+    global _table_index, _table_index_profile, _similar_table_finder
+    # Imported here so Anki's startup does not load BeautifulSoup
+    from .table_index import TableIndex
+    from .similarity import SimilarTableFinder
+    if _table_index is None or _table_index_profile != mw.pm.name:
+        _table_index = TableIndex(user_files_path(f"table_index_{mw.pm.name}.sqlite"))
+        _table_index_profile = mw.pm.name
+        _similar_table_finder = SimilarTableFinder()
+    return _table_index
+
+
+def get_similar_table_finder():
+    """Return the similar table finder of the current profile, refreshed from the table index."""
+    index = get_table_index()
+    _similar_table_finder.refresh(index)
+    return _similar_table_finder
+
+
+def sync_table_index_in_background():
+    """Bring the table index up to date without blocking the UI."""
+    global _table_index_sync_running
+    if _table_index_sync_running or not mw.col:
+        return
+    _table_index_sync_running = True
+
+    def on_done(_):
+        global _table_index_sync_running
+        _table_index_sync_running = False
+
+    def on_failure(error):
+        on_done(None)
+        logger.error("Table index sync failed: %s", error)
+
+    # The index is opened in the background operation, which also imports the parsing modules off the main thread
+    QueryOp(parent=mw, op=lambda col: get_table_index().sync(col), success=on_done).failure(on_failure) \
+        .run_in_background()
+
+
+_tag_registry = None
+_tag_registry_profile = None
+
+
+def get_tag_registry(col):
+    """Return the table tag registry of the current profile, reading the tags of the collection the first time."""
+    global _tag_registry, _tag_registry_profile
+    from .tags import TagRegistry
+    if _tag_registry is None or _tag_registry_profile != mw.pm.name:
+        _tag_registry = TagRegistry().build(col)
+        _tag_registry_profile = mw.pm.name
+    return _tag_registry
+
+
+def invalidate_tag_registry():
+    """Drop the cached tag registry so the next use reads the tags again."""
+    global _tag_registry
+    _tag_registry = None
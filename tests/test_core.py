@@ -0,0 +1,190 @@
+"""Differential and round-trip checks of the regex-based HTML code, on generated fields.
+
+Run with pytest from the repository root. Like the benchmark, they only need the core modules and bs4, not Anki.
+"""
+import os
+import random
+import re
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'src'))
+
+from bs4 import BeautifulSoup
+
+from anking_tables.canonical import table_fingerprint
+from anking_tables.history import EditHistory
+from anking_tables.lint import TableLinter
+from anking_tables.locate import table_spans, split_tables, splice_tables, join_tables, splice_edited_tables
+from anking_tables.reflow import reflow_html, minify_html, compact_edited_tables
+
+# Generated fields per check, the seeds are fixed so a failure names the field that caused it
+FIELDS = 500
+
+INLINE_TAGS = ['b', 'u', 'i', 'span', 'div', 'font', 'br', 'img', 'a', 'sub', 'sup', 'p', 'strong']
+
+INLINE_ATTRIBUTES = ['', ' style="c"', ' class="q" colspan="2"', ' src="a.png" width="3" height=""',
+                     ' title="a > b"', " alt='<table>'"]
+
+CELL_ATTRIBUTES = ['', '', ' colspan="3"', ' rowspan="2"', ' style="x" colspan="2" rowspan="2"', ' colspan=""']
+
+_LAYOUT_SPACE = re.compile(r'[ \t\n\r\f]')
+
+# Text the locator must not take for tables
+DECOYS = ['<!-- <table> -->', '<script>var t = "<table>";</script>', '<style>table > td {}</style>', '&lt;table&gt;']
+
+
+def generate_inline(rng, depth):
+    parts = []
+    for _ in range(rng.randint(0, 3)):
+        r = rng.random()
+        if r < 0.4:
+            parts.append(rng.choice(['x', 'Photo credit: y', ' ', '&amp;', 'z w', '\xa0']))
+        elif r < 0.8 and depth < 3:
+            tag = rng.choice(INLINE_TAGS)
+            attributes = rng.choice(INLINE_ATTRIBUTES)
+            if tag in ('br', 'img'):
+                parts.append(f'<{tag}{attributes}>')
+            else:
+                parts.append(f'<{tag}{attributes}>{generate_inline(rng, depth + 1)}</{tag}>')
+        elif r < 0.9:
+            parts.append(rng.choice(DECOYS))
+        elif depth < 2:
+            parts.append(generate_table(rng, depth + 1))
+    return ''.join(parts)
+
+
+def generate_row(rng, depth):
+    cells = ''.join(f'<{name}{rng.choice(CELL_ATTRIBUTES)}>{generate_inline(rng, depth)}</{name}>'
+                    for name in (rng.choice(['td', 'td', 'th']) for _ in range(rng.choice([1, 1, 2, 3]))))
+    return f'<tr{rng.choice(["", " style=a"])}>{cells}</tr>' + rng.choice(['', '\n', ' ', '\n  '])
+
+
+def generate_table(rng, depth=0):
+    rows = ''.join(generate_row(rng, depth) for _ in range(rng.randint(0, 5)))
+    r = rng.random()
+    if r < 0.3:
+        rows = f'<tbody>{rows}</tbody>'
+    elif r < 0.4:
+        rows = f'<thead>{generate_row(rng, depth)}</thead>\n<tbody>{rows}</tbody>'
+    elif r < 0.45:
+        rows = '<caption>c</caption>' + rows
+    return '<TABLE%s>%s</table>' % (rng.choice(['', ' class=x style="y" border=0']), rows)
+
+
+def generate_field(seed):
+    rng = random.Random(seed)
+    field = ''.join(rng.choice([generate_table(rng), 'text<br>', f'<div>{generate_table(rng)}</div>',
+                                rng.choice(DECOYS)])
+                    for _ in range(rng.randint(1, 3)))
+    if rng.random() < 0.2:
+        # Cells whose end tags are left out, as HTML allows
+        field = field.replace('</td>', '')
+    return field
+
+
+def top_level_tables(html):
+    soup = BeautifulSoup(html, 'html.parser')
+    return [str(table) for table in soup.find_all('table') if table.find_parent('table') is None]
+
+
+@pytest.mark.parametrize('html, expected', [
+    ('no table', []),
+    ('<table><tr><td>a</td></tr></table>', [(0, 34)]),
+    ('a<table><tr><td><table></table></td></tr></table>b', [(1, 49)]),
+    ('<!-- <table> --><table title="a > b"></table>', [(16, 45)]),
+    ('<script>"<table>"</script><style>table {}</style>', []),
+    ('<table><tr><td>never closed', [(0, 27)]),
+    ('<tablet></tablet><TABLE></TABLE >', [(17, 33)]),
+    ('<img alt="<table>"><table></table>', [(19, 34)]),
+    ("<div title='a <table>'>a</div>", []),
+])
+def test_table_spans_cases(html, expected):
+    assert table_spans(html) == expected
+
+
+@pytest.mark.parametrize('seed', range(FIELDS))
+def test_table_spans_match_html_parser(seed):
+    html = generate_field(seed)
+    tables = split_tables(html)
+    assert [str(BeautifulSoup(table, 'html.parser').find('table')) for table in tables] == top_level_tables(html)
+
+
+@pytest.mark.parametrize('seed', range(FIELDS))
+def test_splice_tables_leaves_the_rest_byte_identical(seed):
+    html = generate_field(seed)
+    spans = table_spans(html)
+    assert splice_tables(html, spans, {}) == html
+    assert splice_edited_tables(html, join_tables(split_tables(html))) == html
+    for position, (start, end) in enumerate(spans):
+        assert splice_tables(html, spans, {position: '<table></table>'}) == html[:start] + '<table></table>' + html[end:]
+
+
+def test_splice_edited_tables_refuses_other_table_counts():
+    field = 'a<table><tr><td>1</td></tr></table>b'
+    for edited in ('', 'text', join_tables([field[1:-1], field[1:-1]])):
+        with pytest.raises(ValueError):
+            splice_edited_tables(field, edited)
+    with pytest.raises(ValueError):
+        splice_edited_tables('no table', field)
+
+
+@pytest.mark.parametrize('seed', range(FIELDS))
+def test_reflow_round_trip(seed):
+    html = generate_field(seed)
+    reflowed = reflow_html(html)
+    minified = minify_html(html)
+    assert _LAYOUT_SPACE.sub('', reflowed) == _LAYOUT_SPACE.sub('', html)
+    assert minify_html(reflowed) == minified
+    assert reflow_html(minified) == reflowed
+    assert minify_html(minified) == minified
+    assert reflow_html(reflowed) == reflowed
+    # Only layout whitespace changes, which the fingerprints ignore
+    fingerprints = [table_fingerprint(table) for table in split_tables(html)]
+    assert [table_fingerprint(table) for table in split_tables(reflowed)] == fingerprints
+    assert [table_fingerprint(table) for table in split_tables(minified)] == fingerprints
+    # An untouched table is given back byte for byte
+    edited = join_tables(split_tables(html))
+    assert compact_edited_tables(reflow_html(edited), edited) == edited
+
+
+def test_tags_inside_attribute_values_are_text():
+    html = '<table><tr><td><i title="<tr> <td>">x</i></td><td>y</td></tr></table>'
+    assert '"<tr> <td>"' in reflow_html(html)
+    assert TableLinter().lint(html) == []
+
+
+def test_fingerprint_keeps_inline_whitespace():
+    assert table_fingerprint('<table><tr><td><b>a</b> <i>b</i></td></tr></table>') != \
+        table_fingerprint('<table><tr><td><b>a</b><i>b</i></td></tr></table>')
+
+
+def mutate(rng, text):
+    for _ in range(rng.randint(1, 4)):
+        start = rng.randint(0, len(text))
+        end = min(len(text), start + rng.randint(0, 30))
+        text = text[:start] + rng.choice(['', '<b>', '</td><td>', 'x' * rng.randint(0, 10), '<tr>']) + text[end:]
+    return text
+
+
+@pytest.mark.parametrize('seed', range(100))
+def test_history_goto(seed):
+    rng = random.Random(seed)
+    text = '<table>' + ''.join(f'<tr><td>c{i}</td><td>v{i}</td></tr>' for i in range(rng.randint(0, 30))) + '</table>'
+    history = EditHistory(text, max_versions=rng.choice([5, 200]))
+    # Text of every kept version by its number in the session, checked against goto
+    versions = {1: text}
+    for _ in range(30):
+        if rng.random() < 0.2:
+            version = rng.randrange(len(history))
+            assert history.goto(version) == versions[history.dropped + version + 1]
+        number = history.dropped + history.current + 2
+        text = mutate(rng, history.text)
+        if history.record(text, 'Edit'):
+            versions = {key: value for key, value in versions.items() if key < number}
+            versions[number] = text
+    for version, (number, _) in enumerate(history.entries()):
+        assert history.goto(version) == versions[number]
+    with pytest.raises(IndexError):
+        history.goto(len(history))